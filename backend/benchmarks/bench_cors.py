@@ -0,0 +1,131 @@
+"""
+CORS middleware overhead benchmark: BaseHTTPMiddleware vs. pure ASGI.
+
+Drives a trivial ASGI app directly (no sockets) with and without each
+middleware and reports the added time per request.
+
+Usage (from backend/):
+    python -m benchmarks.bench_cors [--requests N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from server import CustomCORSMiddleware
+
+ORIGIN = "https://preview-app.vercel.app"
+
+
+class LegacyCORSMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation CustomCORSMiddleware replaced."""
+    
+    ALLOWED_PATTERNS = CustomCORSMiddleware.ALLOWED_PATTERNS
+    
+    async def dispatch(self, request: Request, call_next):
+        origin = request.headers.get("origin")
+        is_allowed = self._is_origin_allowed(origin)
+        
+        if request.method == "OPTIONS":
+            response = JSONResponse(content={}, status_code=200)
+            if is_allowed and origin:
+                response.headers["Access-Control-Allow-Origin"] = origin
+                response.headers["Access-Control-Allow-Credentials"] = "true"
+                response.headers["Access-Control-Allow-Methods"] = "*"
+                response.headers["Access-Control-Allow-Headers"] = "*"
+            return response
+        
+        response = await call_next(request)
+        if is_allowed and origin:
+            response.headers["Access-Control-Allow-Origin"] = origin
+            response.headers["Access-Control-Allow-Credentials"] = "true"
+        return response
+    
+    def _is_origin_allowed(self, origin: Optional[str]) -> bool:
+        if not origin:
+            return False
+        return any(pattern in origin for pattern in self.ALLOWED_PATTERNS)
+
+
+async def endpoint(scope, receive, send):
+    """Minimal JSON endpoint so the middleware dominates the timing."""
+    await JSONResponse({"status": "healthy"})(scope, receive, send)
+
+
+def make_scope(method: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": "/api/health",
+        "raw_path": b"/api/health",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"origin", ORIGIN.encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+async def time_requests(app, method: str, count: int) -> float:
+    """Return the median microseconds per request through app."""
+    never = asyncio.Event()
+    
+    async def send(message):
+        pass
+    
+    samples = []
+    for _ in range(count):
+        body_sent = False
+        
+        # Like a server: one body message, then block until disconnect
+        async def receive():
+            nonlocal body_sent
+            if body_sent:
+                await never.wait()
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        scope = make_scope(method)
+        start = time.perf_counter()
+        await app(scope, receive, send)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+async def run(count: int) -> None:
+    apps = {
+        "none": endpoint,
+        "BaseHTTPMiddleware": LegacyCORSMiddleware(endpoint),
+        "pure ASGI": CustomCORSMiddleware(endpoint),
+    }
+    
+    # Warm up every path first
+    for app in apps.values():
+        await time_requests(app, "GET", 200)
+    
+    baseline = await time_requests(apps["none"], "GET", count)
+    print(f"{'middleware':<20}{'GET us':>10}{'overhead us':>14}{'OPTIONS us':>12}")
+    for name, app in apps.items():
+        get_us = await time_requests(app, "GET", count)
+        options_us = await time_requests(app, "OPTIONS", count) if name != "none" else float("nan")
+        print(f"{name:<20}{get_us:>10.1f}{get_us - baseline:>14.1f}{options_us:>12.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Certificate render benchmark: cached static layer vs. full redraw.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pdf_template [--iterations N]
+"""
+
+import argparse
+import statistics
+import time
+
+from server import _prepare_pdf_data, render_certificate_pdf
+
+SAMPLE_RESULT = {
+    "certificate_id": "BE4C0001",
+    "calculation_type": "AFFORDABILITY",
+    "applicant": {"name": "Benchmark Applicant", "email": "bench@example.com"},
+    "issue_date": "2025-01-01",
+    "expiry_date": "2025-04-01",
+    "validity_days": 90,
+    "dsr_ratio": 0.4,
+    "affordable_payment_formatted": "TTD $2,500.00",
+    "max_loan_formatted": "TTD $348,951.93",
+    "interest_rate_percent": 6.0,
+    "term_years": 20,
+    "stress_test": {
+        "stress_rate_bps": 200,
+        "stress_rate_percent": 8.0,
+        "stress_max_loan_formatted": "TTD $298,885.73",
+        "reduction_percent": 14.35
+    }
+}
+
+
+def time_renders(pdf_data: dict, iterations: int) -> dict:
+    """Return per-render wall times in milliseconds for both modes."""
+    # Warm up caches (including the static layer) before timing
+    for _ in range(20):
+        render_certificate_pdf(pdf_data, use_template=False)
+        render_certificate_pdf(pdf_data, use_template=True)
+    
+    # Interleave the modes so machine noise hits both equally
+    samples = {False: [], True: []}
+    for _ in range(iterations):
+        for use_template in (False, True):
+            start = time.perf_counter()
+            render_certificate_pdf(pdf_data, use_template=use_template)
+            samples[use_template].append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+    
+    pdf_data = _prepare_pdf_data(SAMPLE_RESULT)
+    samples = time_renders(pdf_data, args.iterations)
+    
+    full_median = statistics.median(samples[False])
+    cached_median = statistics.median(samples[True])
+    print(f"full redraw    median {full_median:.3f} ms")
+    print(f"static layer   median {cached_median:.3f} ms")
+    print(f"reduction      {(1 - cached_median / full_median) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Benchmark and load-test suite for the Pre-Qualification App API.
+
+Startup timing imports the server in fresh interpreters. Micro-benchmarks
+time the core functions directly. The load generator
+drives /api/calculate and /api/generate-certificate/{certificate_id}
+through the ASGI app in-process (no sockets) with concurrent clients.
+Results are written as JSON and can be compared against a saved baseline.
+
+Usage (from backend/):
+    python -m benchmarks.run                          # run, write results JSON
+    python -m benchmarks.run --save-baseline          # also store as the baseline
+    python -m benchmarks.run --compare                # diff against the baseline
+    python -m benchmarks.run --quick                  # smaller run for smoke checks
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Keep the registry and saved PDFs out of the real certificates directory
+BENCH_STORAGE = Path(tempfile.mkdtemp(prefix="prequal-bench-"))
+os.environ["CERT_REGISTRY_PATH"] = str(BENCH_STORAGE / "registry.db")
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+server.PDF_DIR = BENCH_STORAGE
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "latest.json"
+DEFAULT_BASELINE = BENCH_DIR / "results" / "baseline.json"
+
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = {"throughput_rps"}
+
+# Metrics that can fail a comparison; tail percentiles are reported but too noisy to gate on
+GATED_METRICS = {"p50_us", "throughput_rps"}
+
+# ============================================================================
+# STATISTICS
+# ============================================================================
+
+def summarize(samples_us: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (microseconds) as percentiles."""
+    ordered = sorted(samples_us)
+    
+    def pct(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return round(ordered[index], 3)
+    
+    return {
+        "count": len(ordered),
+        "mean_us": round(statistics.fmean(ordered), 3),
+        "p50_us": pct(50),
+        "p95_us": pct(95),
+        "p99_us": pct(99),
+        "max_us": round(ordered[-1], 3)
+    }
+
+
+def peak_rss_kb() -> Dict[str, int]:
+    """Peak resident set size of this process and of finished children (render workers)."""
+    return {
+        "self_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    }
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+# Run in a fresh interpreter: time the import, report whether ReportLab came with it
+IMPORT_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import server\n"
+    "print(time.perf_counter() - start, 'reportlab' in sys.modules)"
+)
+
+
+def run_startup(scale: float) -> Dict[str, dict]:
+    """Time a cold `import server`, as paid by every new worker."""
+    samples = max(3, int(10 * scale))
+    timings = []
+    for _ in range(samples):
+        elapsed, reportlab_loaded = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=BENCH_DIR.parent, capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(elapsed) * 1e6)
+    
+    summary = summarize(timings)
+    summary["reportlab_loaded"] = reportlab_loaded == "True"
+    print(f"  import server                p50 {summary['p50_us'] / 1000:>10.1f} ms  "
+          f"(reportlab loaded: {summary['reportlab_loaded']})")
+    return {"import_server": summary}
+
+# ============================================================================
+# MICRO-BENCHMARKS
+# ============================================================================
+
+def sample_pdf_data() -> dict:
+    """Certificate data for a typical affordability result with stress test."""
+    request = server.CalculationRequest.model_validate({
+        "calculation_type": "AFFORDABILITY",
+        "applicant": {"name": "Benchmark Applicant", "email": "bench@example.com"},
+        "affordability_input": {
+            "gross_monthly_income": 10000,
+            "dsr_ratio": 0.4,
+            "monthly_obligations": 1500,
+            "annual_interest_rate": 0.06,
+            "term_years": 20,
+            "stress_rate_bps": 200
+        }
+    })
+    result = server._base_result(request)
+    result.update(server._process_affordability(request))
+    return server._prepare_pdf_data(result)
+
+
+def time_call(fn: Callable[[], object], samples: int, inner: int) -> Dict[str, float]:
+    """Time fn, averaging `inner` calls per sample to stay above timer resolution."""
+    for _ in range(max(1, samples // 10)):
+        fn()
+    
+    gc.collect()
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        timings.append((time.perf_counter() - start) / inner * 1e6)
+    return summarize(timings)
+
+
+def run_micro(scale: float) -> Dict[str, dict]:
+    """Run the function-level benchmarks."""
+    pdf_data = sample_pdf_data()
+    samples = max(20, int(500 * scale))
+    
+    cases = {
+        "calculate_monthly_payment": (
+            lambda: server.calculate_monthly_payment(350_000, 0.06, 20), 1000
+        ),
+        "calculate_max_loan": (
+            lambda: server.calculate_max_loan(2_500, 0.06, 20), 1000
+        ),
+        "format_currency": (
+            lambda: server.format_currency(348_951.93, "TTD"), 1000
+        ),
+        "render_certificate_pdf": (
+            lambda: server.render_certificate_pdf(pdf_data), 1
+        ),
+        "generate_certificate_pdf": (
+            lambda: server.generate_certificate_pdf(pdf_data), 1
+        ),
+    }
+    
+    results = {}
+    for name, (fn, inner) in cases.items():
+        results[name] = time_call(fn, samples, inner)
+        print(f"  {name:<28} p50 {results[name]['p50_us']:>10.3f} us")
+    return results
+
+# ============================================================================
+# LOAD GENERATOR
+# ============================================================================
+
+def calculation_payload(rng: random.Random) -> dict:
+    """Random but reproducible calculation request."""
+    if rng.random() < 0.5:
+        income = round(rng.uniform(5_000, 50_000), 2)
+        return {
+            "calculation_type": "AFFORDABILITY",
+            "applicant": {"name": "Load Test"},
+            "affordability_input": {
+                "gross_monthly_income": income,
+                "dsr_ratio": round(rng.uniform(0.3, 0.5), 2),
+                "monthly_obligations": round(rng.uniform(0, income * 0.2), 2),
+                "annual_interest_rate": round(rng.uniform(0.03, 0.12), 4),
+                "term_years": rng.randint(5, 30),
+                "stress_rate_bps": rng.choice([0, 200])
+            }
+        }
+    return {
+        "calculation_type": "PAYMENT",
+        "applicant": {"name": "Load Test"},
+        "payment_input": {
+            "principal_amount": round(rng.uniform(50_000, 2_000_000), 2),
+            "annual_interest_rate": round(rng.uniform(0.03, 0.12), 4),
+            "term_years": rng.randint(5, 30),
+            "stress_rate_bps": rng.choice([0, 200])
+        }
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    make_request: Callable[[httpx.AsyncClient, int], object],
+    total: int,
+    concurrency: int
+) -> dict:
+    """Issue `total` requests from `concurrency` clients and summarize them."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+    
+    async def worker() -> None:
+        nonlocal errors
+        for index in counter:
+            start = time.perf_counter()
+            response = await make_request(client, index)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            if response.status_code != 200:
+                errors += 1
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    
+    summary = summarize(latencies)
+    summary["errors"] = errors
+    summary["throughput_rps"] = round(total / elapsed, 2)
+    return summary
+
+
+async def run_load(scale: float, concurrency: int, seed: int) -> Dict[str, dict]:
+    """Run the in-process load tests."""
+    rng = random.Random(seed)
+    calc_total = max(100, int(5_000 * scale))
+    cert_total = max(20, int(500 * scale))
+    payloads = [calculation_payload(rng) for _ in range(calc_total)]
+    
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up routes and the render pool
+        warm = await client.post("/api/calculate", json=payloads[0])
+        certificate = warm.json()
+        await client.post(
+            f"/api/generate-certificate/{certificate['certificate_id']}", json=certificate
+        )
+        
+        results = {}
+        results["calculate"] = await drive(
+            client,
+            lambda c, i: c.post("/api/calculate", json=payloads[i]),
+            calc_total,
+            concurrency
+        )
+        print(f"  /api/calculate              p50 {results['calculate']['p50_us']:>10.1f} us  "
+              f"{results['calculate']['throughput_rps']:>9.1f} req/s")
+        
+        results["generate_certificate"] = await drive(
+            client,
+            lambda c, i: c.post(
+                f"/api/generate-certificate/{certificate['certificate_id']}", json=certificate
+            ),
+            cert_total,
+            concurrency
+        )
+        print(f"  /api/generate-certificate   p50 {results['generate_certificate']['p50_us']:>10.1f} us  "
+              f"{results['generate_certificate']['throughput_rps']:>9.1f} req/s")
+    
+    server.pdf_render_pool.shutdown()
+    return results
+
+# ============================================================================
+# BASELINE COMPARISON
+# ============================================================================
+
+def flatten(results: dict) -> Dict[str, float]:
+    """Map 'section.case.metric' to value for the comparable metrics."""
+    flat = {}
+    for section in ("startup", "micro", "load"):
+        for case, metrics in results.get(section, {}).items():
+            for metric, value in metrics.items():
+                if metric.endswith("_us") or metric in HIGHER_IS_BETTER:
+                    flat[f"{section}.{case}.{metric}"] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Print a comparison table and return the metrics that regressed."""
+    now, then = flatten(current), flatten(baseline)
+    regressions = []
+    
+    print(f"\n{'metric':<52}{'baseline':>12}{'current':>12}{'change':>9}")
+    for key in sorted(now.keys() & then.keys()):
+        if not key.endswith(("p50_us", "p95_us", "p99_us", "throughput_rps")):
+            continue
+        old, new = then[key], now[key]
+        if not old:
+            continue
+        metric = key.rsplit(".", 1)[1]
+        change = (new - old) / old
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if metric in GATED_METRICS and worse > threshold else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:<52}{old:>12.1f}{new:>12.1f}{change * 100:>8.1f}%{flag}")
+    
+    return regressions
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def git_revision() -> Optional[str]:
+    """Current commit, if run from a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write results to --baseline too")
+    parser.add_argument("--compare", action="store_true", help="compare results against --baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10,
+        help="allowed p50/throughput slowdown before flagging (0.10 = 10%%)"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--quick", action="store_true", help="run a tenth of the default work")
+    args = parser.parse_args()
+    
+    scale = 0.1 if args.quick else 1.0
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pdf_render_backend": server.PDF_RENDER_BACKEND,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "scale": scale
+        }
+    }
+    
+    print("startup")
+    results["startup"] = run_startup(scale)
+    
+    server.prepare_storage()
+    print("micro-benchmarks")
+    results["micro"] = run_micro(scale)
+    print("load tests")
+    results["load"] = asyncio.run(run_load(scale, args.concurrency, args.seed))
+    results["peak_rss"] = peak_rss_kb()
+    print(f"  peak RSS {results['peak_rss']['self_kb'] / 1024:.1f} MiB "
+          f"(render workers {results['peak_rss']['children_kb'] / 1024:.1f} MiB)")
+    
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults written to {args.output}")
+    
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"baseline saved to {args.baseline}")
+    
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"no baseline at {args.baseline}; run with --save-baseline first")
+            return 2
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
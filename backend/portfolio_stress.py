@@ -0,0 +1,62 @@
+"""
+Offline portfolio stress run for a CSV loan book.
+
+Applies the same engine as POST /api/portfolio/stress to a local file,
+reading and writing in chunks so memory stays flat for any book size.
+The per-loan CSV goes to --output (stdout by default); the per-scenario
+summary is printed to stderr.
+
+Usage (from backend/):
+    python portfolio_stress.py loans.csv --bps 100 200 300 --output stressed.csv
+    python portfolio_stress.py loans.csv --bps 200 --summary-only
+"""
+
+import argparse
+import csv
+import sys
+from pathlib import Path
+
+import server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("portfolio", type=Path, help="CSV with principal, annual_interest_rate, remaining_term_months")
+    parser.add_argument("--bps", type=int, nargs="+", default=[200], help="rate shocks in basis points")
+    parser.add_argument("--dsr-threshold", type=float, default=0.4)
+    parser.add_argument("--output", type=Path, help="per-loan CSV (default: stdout)")
+    parser.add_argument("--summary-only", action="store_true", help="skip per-loan rows")
+    parser.add_argument("--chunk-rows", type=int, default=server.PORTFOLIO_CHUNK_ROWS)
+    args = parser.parse_args()
+    
+    totals = server.PortfolioTotals(sorted(set(args.bps)), args.dsr_threshold)
+    
+    with open(args.portfolio, newline="", encoding="utf-8-sig") as source:
+        reader = csv.reader(source)
+        try:
+            columns = server.read_portfolio_header(reader)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        
+        blocks = server.stress_portfolio(
+            reader, columns, totals,
+            emit_rows=not args.summary_only, chunk_rows=args.chunk_rows
+        )
+        if args.summary_only:
+            for _ in blocks:
+                pass
+        elif args.output:
+            with open(args.output, "w", newline="") as sink:
+                sink.writelines(blocks)
+        else:
+            sys.stdout.writelines(blocks)
+    
+    writer = csv.DictWriter(sys.stderr, fieldnames=server.PortfolioTotals.SUMMARY_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(totals.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
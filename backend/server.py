@@ -3,18 +3,60 @@ Pre-Qualification App API
 A FastAPI application for mortgage pre-qualification calculations and PDF certificate generation.
 """
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel, Field, field_validator
-from typing import Optional, Literal
-from datetime import datetime, timedelta
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import FastAPI, HTTPException, Query, Request, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, field_validator, model_validator, ValidationError
+from typing import (
+    Optional, Literal, List, Dict, Any, Callable, Tuple, Iterator, AsyncIterator,
+    Annotated, FrozenSet, NamedTuple, TYPE_CHECKING
+)
+from datetime import date, datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import asyncio
+import base64
+import bisect
+import contextvars
+import cProfile
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+from collections import Counter, OrderedDict, defaultdict
 import math
+import multiprocessing
+import os
+import random
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
 import uuid
+import zipfile
+from contextlib import aclosing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from pathlib import Path
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.colors import HexColor
+
+# Optional encoders for /api/calculate responses; json is used without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+if TYPE_CHECKING:
+    # ReportLab is imported on first render (see warm_up_pdf_engine)
+    from reportlab.pdfgen.canvas import Canvas
 
 # ============================================================================
 # APPLICATION SETUP
@@ -26,27 +68,254 @@ app = FastAPI(
     version="1.0.0"
 )
 
+logger = logging.getLogger(__name__)
+
 # PDF storage directory
 PDF_DIR = Path("/app/backend/certificates")
-PDF_DIR.mkdir(exist_ok=True)
+
+# Seconds browsers may cache a CORS preflight answer
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", 600))
+
+# Memoized calculation results (size 0 disables the cache)
+CALC_CACHE_SIZE = int(os.environ.get("CALC_CACHE_SIZE", 4096))
+CALC_CACHE_TTL_SECONDS = float(os.environ.get("CALC_CACHE_TTL_SECONDS", 300))
+
+# PDF rendering backend: "process", "thread" or "inline" (on the event loop)
+PDF_RENDER_BACKEND = os.environ.get("PDF_RENDER_BACKEND", "process")
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", os.cpu_count() or 1))
+PDF_RENDER_QUEUE_SIZE = int(os.environ.get("PDF_RENDER_QUEUE_SIZE", 32))
+
+# Keep a copy of each rendered certificate in PDF_DIR (off the response path)
+PDF_PERSIST = os.environ.get("PDF_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# Certificate registry (SQLite) and its expiry sweeper
+CERT_REGISTRY_PATH = Path(os.environ.get("CERT_REGISTRY_PATH", str(PDF_DIR / "registry.db")))
+CERT_REGISTRY_MAX_ENTRIES = int(os.environ.get("CERT_REGISTRY_MAX_ENTRIES", 100_000))
+CERT_SWEEP_INTERVAL_SECONDS = int(os.environ.get("CERT_SWEEP_INTERVAL_SECONDS", 3600))
+
+# Asynchronous certificate jobs (see CERTIFICATE JOBS)
+CERT_JOB_WORKERS = int(os.environ.get("CERT_JOB_WORKERS", PDF_RENDER_WORKERS))
+CERT_JOB_QUEUE_SIZE = int(os.environ.get("CERT_JOB_QUEUE_SIZE", 1000))
+CERT_JOB_RETENTION_SECONDS = int(os.environ.get("CERT_JOB_RETENTION_SECONDS", 3600))
+
+# HMAC key for certificate verification tokens; previous keys still verify after rotation.
+# Required when serving with several workers (see check_signing_key); otherwise a
+# missing key falls back to a random per-process key with a warning.
+CERT_SIGNING_KEY_CONFIGURED = bool(os.environ.get("CERT_SIGNING_KEY", ""))
+CERT_SIGNING_KEY = os.environ.get("CERT_SIGNING_KEY", "").encode() or secrets.token_bytes(32)
+CERT_SIGNING_PREVIOUS_KEYS = [
+    key.strip().encode()
+    for key in os.environ.get("CERT_SIGNING_PREVIOUS_KEYS", "").split(",") if key.strip()
+]
+
+# Opt-in cProfile capture of calculate/certificate requests (see PROFILING)
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/app/backend/profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 100))
+
+# Worker processes serving the app, as read by uvicorn and gunicorn
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# Load ReportLab and build certificate templates at startup instead of on first render
+PDF_WARM_UP = os.environ.get("PDF_WARM_UP", "false").lower() in ("1", "true", "yes")
+
+# Admission control per endpoint class: requests running at once and requests
+# allowed to wait before 429 (a concurrency of 0 leaves the class uncapped)
+ADMISSION_PDF_CONCURRENCY = int(os.environ.get("ADMISSION_PDF_CONCURRENCY", PDF_RENDER_WORKERS))
+ADMISSION_PDF_QUEUE_SIZE = int(os.environ.get("ADMISSION_PDF_QUEUE_SIZE", PDF_RENDER_QUEUE_SIZE))
+ADMISSION_CALCULATION_CONCURRENCY = int(os.environ.get("ADMISSION_CALCULATION_CONCURRENCY", 0))
+ADMISSION_CALCULATION_QUEUE_SIZE = int(os.environ.get("ADMISSION_CALCULATION_QUEUE_SIZE", 0))
 
 # Brand colors
-COLORS = {
-    "lime_green": HexColor('#32CD32'),
-    "dark_green": HexColor('#228B22'),
-    "white": HexColor('#FFFFFF'),
-    "light_bg": HexColor('#F0FFF0'),
-    "warning": HexColor('#FD7E14')
+BRAND_COLORS = {
+    "lime_green": '#32CD32',
+    "dark_green": '#228B22',
+    "white": '#FFFFFF',
+    "light_bg": '#F0FFF0',
+    "warning": '#FD7E14'
+}
+
+
+class _ColorTable(dict):
+    """BRAND_COLORS as ReportLab colors, converted on first lookup."""
+    
+    def __missing__(self, name: str):
+        from reportlab.lib.colors import HexColor
+        color = self[name] = HexColor(BRAND_COLORS[name])
+        return color
+
+
+COLORS = _ColorTable()
+
+
+def prepare_storage() -> None:
+    """Create the certificate directory."""
+    PDF_DIR.mkdir(parents=True, exist_ok=True)
+
+
+@app.on_event("startup")
+async def prepare_storage_on_startup():
+    """Set up the filesystem before serving requests."""
+    prepare_storage()
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+def retry_after_seconds(backlog: int, workers: int, mean_seconds: float) -> int:
+    """Estimate when a slot frees up: the backlog ahead, drained by `workers`, clamped to 1-60s."""
+    return min(60, max(1, math.ceil((backlog + 1) * mean_seconds / max(1, workers))))
+
+
+class AdmissionGate:
+    """
+    Concurrency cap with a bounded wait queue for one class of endpoints.
+    
+    At most `concurrency` requests of the class run at once and at most
+    `queue_size` more wait for a slot; anything beyond that is turned away
+    immediately. A concurrency of 0 or less leaves the class uncapped and
+    only counts it. Only used from the event loop thread.
+    """
+    
+    # Weight of the newest request in the running mean service time
+    SMOOTHING = 0.2
+    
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = max(0, queue_size)
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.mean_seconds = 1.0
+        self._slots = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+    
+    def full(self) -> bool:
+        """Whether a new request would find neither a slot nor a queue place."""
+        return (
+            self._slots is not None
+            and self.active + self.queued >= self.concurrency + self.queue_size
+        )
+    
+    async def acquire(self) -> None:
+        """Wait for a slot; call only when not full()."""
+        self.queued += 1
+        try:
+            if self._slots is not None:
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        self.admitted += 1
+    
+    def release(self, elapsed: float) -> None:
+        """Free the slot and fold the request's duration into the mean."""
+        self.active -= 1
+        if self._slots is not None:
+            self._slots.release()
+        self.mean_seconds += self.SMOOTHING * (elapsed - self.mean_seconds)
+    
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying."""
+        return retry_after_seconds(self.queued, max(1, self.concurrency), self.mean_seconds)
+    
+    def stats(self) -> dict:
+        """Return limits, current occupancy and counters."""
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "mean_seconds": round(self.mean_seconds, 4)
+        }
+
+
+admission_gates = {
+    "pdf": AdmissionGate("pdf", ADMISSION_PDF_CONCURRENCY, ADMISSION_PDF_QUEUE_SIZE),
+    "calculation": AdmissionGate(
+        "calculation", ADMISSION_CALCULATION_CONCURRENCY, ADMISSION_CALCULATION_QUEUE_SIZE
+    )
 }
 
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware applying the admission gate of each endpoint class.
+    
+    PDF rendering and calculations have separate gates, so a burst of
+    certificate downloads queues behind its own cap while calculations keep
+    flowing. Requests that find their class full get 429 with Retry-After
+    before the body is read. Other routes pass straight through.
+    """
+    
+    # (class, method, path pattern). Downloads are mostly served from the
+    # registry, so they share the cheap class; a render on a miss is still
+    # bounded by the render pool.
+    ROUTES = [
+        ("pdf", "POST", re.compile(r"/api/generate-certificates?(/[^/]+)?")),
+        ("calculation", "GET", re.compile(r"/api/certificates/[^/]+/pdf")),
+        ("calculation", "POST", re.compile(
+            r"/api/(calculate(/batch)?|solve(/batch)?|stress-surface|schedule"
+            r"|simulate/variable-rate|portfolio/stress)"
+        ))
+    ]
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        gate = self._gate(scope) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        
+        if gate.full():
+            gate.rejected += 1
+            response = JSONResponse(
+                {"detail": f"Too many {gate.name} requests in progress, please retry"},
+                status_code=429,
+                headers={"Retry-After": str(gate.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+        
+        await gate.acquire()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - started)
+    
+    def _gate(self, scope: Scope) -> Optional[AdmissionGate]:
+        """Return the gate for this request's endpoint class, if any."""
+        method, path = scope["method"], scope["path"]
+        for name, route_method, pattern in self.ROUTES:
+            if method == route_method and pattern.fullmatch(path):
+                return admission_gates[name]
+        return None
+
+
+# Added before CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # ============================================================================
 # CORS MIDDLEWARE
 # ============================================================================
 
-class CustomCORSMiddleware(BaseHTTPMiddleware):
+class CustomCORSMiddleware:
     """
     Custom CORS middleware that allows requests from specific domain patterns.
     Supports Vercel deployments, local development, and production domains.
+    
+    Implemented as plain ASGI: headers are added to the response start
+    message in place, with no per-request task or body stream wrapping.
+    WebSocket handshakes from a browser origin outside the allowed
+    patterns are refused, since browsers do not apply CORS to them.
     """
     
     # Allowed domain patterns
@@ -57,30 +326,64 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
         "localhost:3001"     # Alternative local port
     ]
     
-    async def dispatch(self, request: Request, call_next):
+    # Distinct origins remembered before the decision cache is reset
+    ORIGIN_CACHE_SIZE = 1024
+    
+    def __init__(self, app: ASGIApp, max_age: int = CORS_MAX_AGE):
+        self.app = app
+        self.max_age = str(max_age)
+        # One compiled alternation replaces the per-request scan of every pattern
+        self._matcher = re.compile("|".join(re.escape(p) for p in self.ALLOWED_PATTERNS))
+        self._decisions: Dict[str, bool] = {}
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process request and add appropriate CORS headers."""
-        origin = request.headers.get("origin")
+        if scope["type"] == "websocket":
+            origin = Headers(scope=scope).get("origin")
+            if origin and not self._is_origin_allowed(origin):
+                # Closing before accept makes the server answer the handshake with 403
+                await send({"type": "websocket.close", "code": 1008})
+                return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        origin = Headers(scope=scope).get("origin")
         is_allowed = self._is_origin_allowed(origin)
         
         # Handle preflight (OPTIONS) requests
-        if request.method == "OPTIONS":
-            return self._create_preflight_response(origin, is_allowed)
+        if scope["method"] == "OPTIONS":
+            response = self._create_preflight_response(origin, is_allowed)
+            await response(scope, receive, send)
+            return
         
-        # Process normal requests
-        response = await call_next(request)
+        if not (is_allowed and origin):
+            await self.app(scope, receive, send)
+            return
         
-        # Add CORS headers if origin is allowed
-        if is_allowed and origin:
-            response.headers["Access-Control-Allow-Origin"] = origin
-            response.headers["Access-Control-Allow-Credentials"] = "true"
+        # Add CORS headers to the response as it starts
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Access-Control-Allow-Origin"] = origin
+                headers["Access-Control-Allow-Credentials"] = "true"
+                headers.add_vary_header("Origin")
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_cors)
     
     def _is_origin_allowed(self, origin: Optional[str]) -> bool:
         """Check if the origin matches any allowed pattern."""
         if not origin:
             return False
-        return any(pattern in origin for pattern in self.ALLOWED_PATTERNS)
+        
+        allowed = self._decisions.get(origin)
+        if allowed is None:
+            if len(self._decisions) >= self.ORIGIN_CACHE_SIZE:
+                self._decisions.clear()
+            allowed = self._matcher.search(origin) is not None
+            self._decisions[origin] = allowed
+        return allowed
     
     def _create_preflight_response(self, origin: Optional[str], is_allowed: bool) -> JSONResponse:
         """Create response for preflight requests."""
@@ -91,12 +394,323 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
             response.headers["Access-Control-Allow-Credentials"] = "true"
             response.headers["Access-Control-Allow-Methods"] = "*"
             response.headers["Access-Control-Allow-Headers"] = "*"
+            # Let browsers reuse this answer instead of preflighting every call
+            response.headers["Access-Control-Max-Age"] = self.max_age
+            response.headers["Vary"] = "Origin"
         
         return response
 
 
 app.add_middleware(CustomCORSMiddleware)
 
+# ============================================================================
+# METRICS
+# ============================================================================
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram with one series per label value.
+    
+    Observing is a bisect and two additions under a lock, cheap enough to
+    leave on for every request.
+    """
+    
+    # Seconds; spans sub-millisecond validation up to slow PDF renders
+    DEFAULT_BUCKETS = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+        0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+    )
+    
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, label_value: str, seconds: float) -> None:
+        """Record one observation."""
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # Per-bucket counts, then +Inf count and running sum
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, seconds)] += 1
+            series[-1] += seconds
+    
+    def time(self, label_value: str) -> "_StageTimer":
+        """Context manager that observes its own duration."""
+        return _StageTimer(self, label_value)
+    
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        
+        for value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class _StageTimer:
+    """Times a block into a Histogram series."""
+    
+    __slots__ = ("histogram", "label_value", "start")
+    
+    def __init__(self, histogram: Histogram, label_value: str):
+        self.histogram = histogram
+        self.label_value = label_value
+    
+    def __enter__(self) -> "_StageTimer":
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(self.label_value, time.perf_counter() - self.start)
+
+
+STAGE_LATENCY = Histogram(
+    "prequal_stage_duration_seconds",
+    "Time spent in each stage of request handling",
+    "stage"
+)
+
+REQUEST_LATENCY = Histogram(
+    "prequal_http_request_duration_seconds",
+    "Total time to handle a request, by route",
+    "route"
+)
+
+# (method, route, status) -> count
+REQUEST_COUNTS: Dict[Tuple[str, str, int], int] = defaultdict(int)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that counts requests and times them by route.
+    
+    Also records the response_send stage: from the response start message
+    to the last body chunk.
+    """
+    
+    # Shared across instances so the metrics endpoint can read it
+    in_flight = 0
+    
+    # Method labels kept as sent; anything else is counted as "OTHER"
+    METHODS = frozenset({
+        "GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE", "PATCH"
+    })
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Dict[Any, str] = {}
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+        send_started = 0.0
+        
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, send_started
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                send_started = time.perf_counter()
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                STAGE_LATENCY.observe("response_send", time.perf_counter() - send_started)
+        
+        MetricsMiddleware.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            MetricsMiddleware.in_flight -= 1
+            # The router records the matched endpoint in scope; label by its path template
+            route = self._route_path(scope.get("endpoint"))
+            REQUEST_LATENCY.observe(route, time.perf_counter() - start)
+            method = scope["method"] if scope["method"] in self.METHODS else "OTHER"
+            REQUEST_COUNTS[(method, route, status_code)] += 1
+    
+    def _route_path(self, endpoint: Any) -> str:
+        """Map an endpoint to its route template, keeping label cardinality fixed."""
+        if endpoint is None:
+            return "unmatched"
+        if not self._routes:
+            self._routes = {
+                route.endpoint: route.path
+                for route in app.routes if hasattr(route, "endpoint")
+            }
+        return self._routes.get(endpoint, "unmatched")
+
+
+def render_metrics(in_flight: int) -> str:
+    """Render all metrics in Prometheus text format."""
+    lines = STAGE_LATENCY.render() + REQUEST_LATENCY.render()
+    
+    lines += [
+        "# HELP prequal_http_requests_total Requests handled, by method, route and status",
+        "# TYPE prequal_http_requests_total counter"
+    ]
+    for (method, route, status), count in sorted(REQUEST_COUNTS.items()):
+        lines.append(
+            f'prequal_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+        )
+    
+    lines += [
+        "# HELP prequal_http_requests_in_flight Requests currently being handled",
+        "# TYPE prequal_http_requests_in_flight gauge",
+        f"prequal_http_requests_in_flight {in_flight}",
+        "# HELP prequal_pdf_renders_pending Certificate renders running or waiting for a worker",
+        "# TYPE prequal_pdf_renders_pending gauge",
+        f"prequal_pdf_renders_pending {pdf_render_pool.pending}",
+        "# HELP prequal_certificate_jobs_queued Certificate jobs waiting for a job worker",
+        "# TYPE prequal_certificate_jobs_queued gauge",
+        f"prequal_certificate_jobs_queued {certificate_jobs.depth}",
+        "# HELP prequal_pdf_renders_rejected_total Certificate renders refused because the pool was full",
+        "# TYPE prequal_pdf_renders_rejected_total counter",
+        f"prequal_pdf_renders_rejected_total {pdf_render_pool.rejected}",
+        "# HELP prequal_certificate_jobs_rejected_total Certificate jobs refused because the queue was full",
+        "# TYPE prequal_certificate_jobs_rejected_total counter",
+        f"prequal_certificate_jobs_rejected_total {certificate_jobs.rejected}"
+    ]
+    
+    for metric, kind, help_text, attribute in (
+        ("active", "gauge", "Requests running, by endpoint class", "active"),
+        ("queued", "gauge", "Requests waiting for a slot, by endpoint class", "queued"),
+        ("admitted_total", "counter", "Requests admitted, by endpoint class", "admitted"),
+        ("rejected_total", "counter", "Requests rejected with 429, by endpoint class", "rejected")
+    ):
+        lines += [
+            f"# HELP prequal_admission_{metric} {help_text}",
+            f"# TYPE prequal_admission_{metric} {kind}"
+        ]
+        for name, gate in admission_gates.items():
+            lines.append(f'prequal_admission_{metric}{{class="{name}"}} {getattr(gate, attribute)}')
+    
+    cache = calculation_cache.stats()
+    lines += [
+        "# HELP prequal_calculation_cache_lookups_total Calculation cache lookups, by result",
+        "# TYPE prequal_calculation_cache_lookups_total counter",
+        f'prequal_calculation_cache_lookups_total{{result="hit"}} {cache["hits"]}',
+        f'prequal_calculation_cache_lookups_total{{result="miss"}} {cache["misses"]}'
+    ]
+    
+    return "\n".join(lines) + "\n"
+
+
+app.add_middleware(MetricsMiddleware)
+
+# ============================================================================
+# PROFILING
+# ============================================================================
+
+# Header that asks for a profile of one request
+PROFILE_HEADER = b"x-profile"
+
+# File stem of the profile being captured for the current request, if any
+_profile_stem: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "profile_stem", default=None
+)
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that runs selected requests under cProfile.
+    
+    A request is profiled when it carries an X-Profile header (matching
+    PROFILE_TOKEN if one is set) or is picked by PROFILE_SAMPLE_RATE. Stats
+    are written to PROFILE_DIR as <stem>.prof; certificate renders on the
+    pool are profiled in the worker and written as <stem>-render.prof.
+    
+    Only installed when PROFILE_ENABLED is set, so requests pay nothing
+    otherwise. cProfile follows the event loop thread, so coroutines that
+    interleave with a profiled request show up in its profile too.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # One cProfile per thread; concurrent profiled requests are skipped
+        self._active = False
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = self._route(scope["path"]) if scope["type"] == "http" else None
+        if route is None or self._active or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        stem = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{route}-{uuid.uuid4().hex[:8]}"
+        profiler = cProfile.Profile()
+        token = _profile_stem.set(stem)
+        self._active = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            self._active = False
+            _profile_stem.reset(token)
+            await run_in_threadpool(_write_profile, profiler, stem)
+    
+    @staticmethod
+    def _route(path: str) -> Optional[str]:
+        """Name of the profiled endpoint serving `path`, if any."""
+        if path == "/api/calculate":
+            return "calculate"
+        if path.startswith("/api/generate-certificate/"):
+            return "generate-certificate"
+        return None
+    
+    @staticmethod
+    def _wants_profile(scope: Scope) -> bool:
+        """Check the profile header, then the sampling rate."""
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return not PROFILE_TOKEN or value.decode("latin-1") == PROFILE_TOKEN
+        return random.random() < PROFILE_SAMPLE_RATE
+
+
+def _write_profile(profiler: cProfile.Profile, stem: str) -> None:
+    """Dump profiler stats to PROFILE_DIR and drop the oldest files."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(PROFILE_DIR / f"{stem}.prof"))
+    _rotate_profiles()
+
+
+def _rotate_profiles() -> None:
+    """Keep only the newest PROFILE_MAX_FILES profiles."""
+    profiles = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.name, reverse=True)
+    for stale in profiles[PROFILE_MAX_FILES:]:
+        stale.unlink(missing_ok=True)
+
+
+def _render_certificate_profiled(pdf_data: dict, stem: str) -> Tuple[bytes, Dict[str, float]]:
+    """Render under cProfile in a pool worker and write <stem>-render.prof."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return _render_certificate_timed(pdf_data)
+    finally:
+        profiler.disable()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(PROFILE_DIR / f"{stem}-render.prof"))
+
+
+if PROFILE_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # ============================================================================
 # DATA MODELS
 # ============================================================================
@@ -181,6 +795,220 @@ class CalculationRequest(BaseModel):
         default=90, ge=1, le=365,
         description="Certificate validity period in days"
     )
+    
+    @model_validator(mode="wrap")
+    @classmethod
+    def time_validation(cls, data, handler):
+        """Record how long validation of the whole request takes."""
+        with STAGE_LATENCY.time("validation"):
+            return handler(data)
+
+
+class LiveCalculationState(BaseModel):
+    """Inputs of a live recalculation session; applicant details wait for submit."""
+    calculation_type: Literal["AFFORDABILITY", "PAYMENT"] = Field(
+        ..., description="Type of calculation: AFFORDABILITY or PAYMENT"
+    )
+    affordability_input: Optional[AffordabilityInput] = None
+    payment_input: Optional[PaymentInput] = None
+    currency: Literal["TTD", "USD"] = Field(
+        default="TTD",
+        description="Currency for display (TTD or USD)"
+    )
+
+
+class BatchCalculationRequest(BaseModel):
+    """Batch of calculation requests, validated item by item."""
+    requests: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=10_000,
+        description="CalculationRequest payloads (AFFORDABILITY and PAYMENT may be mixed)"
+    )
+
+
+class ScheduleRequest(BaseModel):
+    """Amortization schedule request."""
+    payment_input: PaymentInput
+    format: Literal["ndjson", "csv"] = Field(
+        default="ndjson",
+        description="Stream format (ndjson or csv)"
+    )
+
+
+
+class BulkCertificateRequest(BaseModel):
+    """Calculation results to render as one ZIP archive."""
+    certificates: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=5_000,
+        description="Results as returned by /api/calculate"
+    )
+
+# Upper bound on rate x term x bps cells in one stress surface
+MAX_SURFACE_CELLS = 100_000
+
+
+class StressSurfaceRequest(BaseModel):
+    """
+    Sensitivity grid request.
+    
+    The affordability or payment input is the base scenario; each axis
+    defaults to that input's own value when omitted.
+    """
+    calculation_type: Literal["AFFORDABILITY", "PAYMENT"] = Field(
+        ..., description="AFFORDABILITY yields max loan, PAYMENT yields monthly payment"
+    )
+    affordability_input: Optional[AffordabilityInput] = None
+    payment_input: Optional[PaymentInput] = None
+    annual_interest_rates: Optional[List[Annotated[float, Field(gt=0.001, le=0.50)]]] = Field(
+        default=None, min_length=1, description="Base annual rates to sweep"
+    )
+    term_years: Optional[List[Annotated[int, Field(ge=1, le=50)]]] = Field(
+        default=None, min_length=1, description="Loan terms in years to sweep"
+    )
+    stress_bps: Optional[List[Annotated[int, Field(ge=0, le=1000)]]] = Field(
+        default=None, min_length=1, description="Rate shocks in basis points to sweep"
+    )
+    currency: Literal["TTD", "USD"] = Field(
+        default="TTD",
+        description="Currency for display (TTD or USD)"
+    )
+
+
+# Upper bound on paths x reset periods in one rate simulation
+MAX_SIMULATION_CELLS = 7_200_000
+
+
+class RateSimulationRequest(BaseModel):
+    """
+    Variable-rate Monte Carlo request.
+    
+    The rate starts at the input's annual_interest_rate and follows a
+    mean-reverting (Ornstein-Uhlenbeck) process, re-fixed every reset_months.
+    AFFORDABILITY simulates the applicant's maximum loan; PAYMENT simulates
+    the given principal.
+    """
+    calculation_type: Literal["AFFORDABILITY", "PAYMENT"] = Field(
+        ..., description="AFFORDABILITY simulates the max loan, PAYMENT the given principal"
+    )
+    affordability_input: Optional[AffordabilityInput] = None
+    payment_input: Optional[PaymentInput] = None
+    gross_monthly_income: Optional[float] = Field(
+        default=None, gt=0, le=1_000_000,
+        description="Income for payment-to-income bands on PAYMENT runs"
+    )
+    paths: int = Field(
+        default=1_000, ge=1, le=20_000,
+        description="Number of simulated rate paths"
+    )
+    seed: Optional[int] = Field(
+        default=None, ge=0, le=2**63 - 1,
+        description="Random seed; the seed used is returned so runs can be replayed"
+    )
+    reset_months: int = Field(
+        default=12, ge=1, le=600,
+        description="Months between rate resets"
+    )
+    mean_reversion: float = Field(
+        default=0.15, ge=0, le=10,
+        description="Annual speed at which the rate reverts to long_run_rate"
+    )
+    volatility: float = Field(
+        default=0.01, ge=0, le=0.25,
+        description="Annual rate volatility in absolute terms (0.01 = 100 bps)"
+    )
+    long_run_rate: Optional[float] = Field(
+        default=None, gt=0, le=0.50,
+        description="Rate the process reverts to; defaults to the starting rate"
+    )
+    rate_floor: float = Field(
+        default=0.0, ge=0, le=0.50,
+        description="Lowest rate a path may reach"
+    )
+    rate_cap: float = Field(
+        default=0.50, gt=0, le=0.50,
+        description="Highest rate a path may reach"
+    )
+    percentiles: List[Annotated[float, Field(ge=0, le=100)]] = Field(
+        default=[5, 25, 50, 75, 95], min_length=1, max_length=21,
+        description="Percentiles reported in each band"
+    )
+    currency: Literal["TTD", "USD"] = Field(
+        default="TTD",
+        description="Currency for display (TTD or USD)"
+    )
+    
+    @model_validator(mode="after")
+    def check_rate_bounds(self) -> "RateSimulationRequest":
+        """Ensure the floor does not exceed the cap."""
+        if self.rate_floor > self.rate_cap:
+            raise ValueError("rate_floor must not exceed rate_cap")
+        return self
+
+
+class SolveRequest(BaseModel):
+    """
+    Inverse affordability problem: find the value of `solve_for` at which
+    the applicant qualifies for `target_loan_amount`.
+    
+    Qualifying means the max loan at annual_interest_rate + stress_rate_bps
+    covers the target. The solved field is ignored if supplied.
+    """
+    solve_for: Literal[
+        "gross_monthly_income", "monthly_obligations", "annual_interest_rate", "term_years"
+    ] = Field(..., description="Parameter to solve for")
+    target_loan_amount: float = Field(
+        ..., gt=0, le=10_000_000,
+        description="Loan amount the applicant must qualify for"
+    )
+    gross_monthly_income: Optional[float] = Field(
+        default=None, gt=0, le=1_000_000,
+        description="Gross monthly income in selected currency"
+    )
+    dsr_ratio: float = Field(
+        default=0.4, ge=0.1, le=0.8,
+        description="Debt Service Ratio (0.1 to 0.8, typically 0.4)"
+    )
+    monthly_obligations: float = Field(
+        default=0, ge=0,
+        description="Existing monthly debt obligations"
+    )
+    annual_interest_rate: Optional[float] = Field(
+        default=None, gt=0.001, le=0.50,
+        description="Annual interest rate (as decimal, e.g., 0.06 for 6%)"
+    )
+    term_years: Optional[int] = Field(
+        default=None, ge=1, le=50,
+        description="Loan term in years"
+    )
+    stress_rate_bps: int = Field(
+        default=0, ge=0, le=1000,
+        description="Stress rate increase the answer must still qualify under"
+    )
+    currency: Literal["TTD", "USD"] = Field(
+        default="TTD",
+        description="Currency for display (TTD or USD)"
+    )
+    
+    @model_validator(mode="after")
+    def require_known_inputs(self) -> "SolveRequest":
+        """Ensure every input except the solved one is present."""
+        required = {
+            "gross_monthly_income": ("annual_interest_rate", "term_years"),
+            "monthly_obligations": ("gross_monthly_income", "annual_interest_rate", "term_years"),
+            "annual_interest_rate": ("gross_monthly_income", "term_years"),
+            "term_years": ("gross_monthly_income", "annual_interest_rate")
+        }[self.solve_for]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"Solving for {self.solve_for} requires {', '.join(missing)}")
+        return self
+
+
+class BatchSolveRequest(BaseModel):
+    """Batch of solve requests, validated item by item."""
+    requests: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=10_000,
+        description="SolveRequest payloads (solve_for may be mixed)"
+    )
 
 # ============================================================================
 # CALCULATION FUNCTIONS
@@ -216,10 +1044,9 @@ def calculate_monthly_payment(
     monthly_rate = annual_rate / 12
     num_payments = term_years * 12
     
-    # Apply amortization formula
-    payment = principal * (
-        monthly_rate * math.pow(1 + monthly_rate, num_payments)
-    ) / (math.pow(1 + monthly_rate, num_payments) - 1)
+    # Apply amortization formula; (1+r)^n appears twice but is computed once
+    growth = math.pow(1 + monthly_rate, num_payments)
+    payment = principal * (monthly_rate * growth) / (growth - 1)
     
     return round(payment, 2)
 
@@ -263,467 +1090,3691 @@ def calculate_max_loan(
     return round(max_loan, 2)
 
 
-def format_currency(amount: float, currency: str = "TTD") -> str:
+def calculate_monthly_payments(
+    principal: np.ndarray,
+    annual_rate: np.ndarray,
+    term_years: np.ndarray
+) -> np.ndarray:
     """
-    Format amount as currency string.
+    Vectorized form of calculate_monthly_payment.
+    
+    Evaluates the same expression in the same operation order, element-wise,
+    so unrounded values agree with the scalar path. Rounding is left to
+    round_cents.
     
     Args:
-        amount: Numeric amount
-        currency: Currency code (TTD or USD)
+        principal: Loan principal amounts
+        annual_rate: Annual interest rates (as decimals)
+        term_years: Loan terms in years
     
     Returns:
-        Formatted string (e.g., "TTD $1,234.56")
+        Unrounded monthly payment amounts
     """
-    return f"{currency} ${amount:,.2f}"
+    monthly_rate = annual_rate / 12
+    num_payments = term_years * 12
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.power(1 + monthly_rate, num_payments)
+        payment = principal * (monthly_rate * growth) / (growth - 1)
+    
+    return np.where(annual_rate == 0, principal / num_payments, payment)
 
-# ============================================================================
+
+def calculate_max_loans(
+    affordable_payment: np.ndarray,
+    annual_rate: np.ndarray,
+    term_years: np.ndarray
+) -> np.ndarray:
+    """
+    Vectorized form of calculate_max_loan.
+    
+    Args:
+        affordable_payment: Monthly payments the applicants can afford
+        annual_rate: Annual interest rates (as decimals)
+        term_years: Loan terms in years
+    
+    Returns:
+        Unrounded maximum loan amounts
+    """
+    monthly_rate = annual_rate / 12
+    num_payments = term_years * 12
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        max_loan = affordable_payment * (
+            1 - np.power(1 + monthly_rate, -num_payments)
+        ) / monthly_rate
+    
+    return np.where(annual_rate == 0, affordable_payment * num_payments, max_loan)
+
+
+def max_loan_sensitivities(
+    affordable_payment: np.ndarray,
+    annual_rate: np.ndarray,
+    term_years: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Closed-form first derivatives of calculate_max_loans.
+    
+    With i = r/12, n = 12 * years and PV = PMT * (1 - (1+i)^-n) / i:
+        dPV/di   = PMT * (n * i * (1+i)^(-n-1) - (1 - (1+i)^-n)) / i^2
+        dPV/dn   = PMT * (1+i)^-n * ln(1+i) / i
+        dPV/dPMT = (1 - (1+i)^-n) / i
+    
+    Args:
+        affordable_payment: Monthly payments the applicants can afford
+        annual_rate: Annual interest rates (as decimals)
+        term_years: Loan terms in years
+    
+    Returns:
+        per_bp (change per basis point of annual rate), per_term_year and
+        per_payment_unit (change per currency unit of monthly payment)
+    """
+    monthly_rate = annual_rate / 12
+    num_payments = term_years * 12
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount = np.power(1 + monthly_rate, -num_payments)
+        factor = (1 - discount) / monthly_rate
+        d_monthly_rate = affordable_payment * (
+            num_payments * monthly_rate * discount / (1 + monthly_rate) - (1 - discount)
+        ) / monthly_rate ** 2
+        d_payments = affordable_payment * discount * np.log1p(monthly_rate) / monthly_rate
+    
+    # Limits as the rate goes to zero, where PV = PMT * n
+    zero = annual_rate == 0
+    factor = np.where(zero, num_payments, factor)
+    d_monthly_rate = np.where(zero, -affordable_payment * num_payments * (num_payments + 1) / 2, d_monthly_rate)
+    d_payments = np.where(zero, affordable_payment, d_payments)
+    
+    return {
+        "per_bp": d_monthly_rate / 12 / 10000,
+        "per_term_year": d_payments * 12,
+        "per_payment_unit": factor
+    }
+
+
+def monthly_payment_sensitivities(
+    principal: np.ndarray,
+    annual_rate: np.ndarray,
+    term_years: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Closed-form first derivatives of calculate_monthly_payments.
+    
+    With i = r/12, n = 12 * years, g = (1+i)^n and M = P * i * g / (g - 1):
+        dM/di = P * (D - n * i * (1+i)^(-n-1)) / D^2, where D = 1 - 1/g
+        dM/dn = -P * i * g * ln(1+i) / (g - 1)^2
+        dM/dP = i * g / (g - 1)
+    
+    Args:
+        principal: Loan principal amounts
+        annual_rate: Annual interest rates (as decimals)
+        term_years: Loan terms in years
+    
+    Returns:
+        per_bp (change per basis point of annual rate), per_term_year and
+        per_principal_unit (change per currency unit of principal)
+    """
+    monthly_rate = annual_rate / 12
+    num_payments = term_years * 12
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.power(1 + monthly_rate, num_payments)
+        remaining = 1 - 1 / growth
+        factor = monthly_rate * growth / (growth - 1)
+        d_monthly_rate = principal * (
+            remaining - num_payments * monthly_rate * np.power(1 + monthly_rate, -num_payments - 1)
+        ) / remaining ** 2
+        d_payments = -principal * monthly_rate * growth * np.log1p(monthly_rate) / (growth - 1) ** 2
+    
+    # Limits as the rate goes to zero, where M = P / n
+    zero = annual_rate == 0
+    factor = np.where(zero, 1 / num_payments, factor)
+    d_monthly_rate = np.where(zero, principal * (num_payments + 1) / (2 * num_payments), d_monthly_rate)
+    d_payments = np.where(zero, -principal / num_payments ** 2, d_payments)
+    
+    return {
+        "per_bp": d_monthly_rate / 12 / 10000,
+        "per_term_year": d_payments * 12,
+        "per_principal_unit": factor
+    }
+
+
+def round_cents(values: np.ndarray, exact: Callable[[int], float]) -> List[float]:
+    """
+    Round an array to 2 decimal places, matching Python's round() exactly.
+    
+    np.round and round() only disagree when a value sits on a half-cent
+    boundary, which is also the only place a last-bit difference between
+    np.power and math.pow can change the cent. Those elements are
+    recomputed through the scalar path.
+    
+    Args:
+        values: Unrounded amounts
+        exact: Returns the scalar-path rounded value for an index
+    
+    Returns:
+        Rounded amounts as Python floats
+    """
+    cents = values * 100
+    near_half = np.abs(cents - np.floor(cents) - 0.5) < 1e-4
+    rounded = np.round(values, 2).tolist()
+    
+    for index in np.flatnonzero(near_half).tolist():
+        rounded[index] = exact(index)
+    
+    return rounded
+
+
+def calculate_amortization_schedule(
+    principal: float,
+    annual_rate: float,
+    term_years: int
+) -> Dict[str, np.ndarray]:
+    """
+    Calculate a month-by-month amortization schedule in integer cents.
+    
+    Balances come from the closed-form remaining-balance formula evaluated
+    over all periods at once, using the rounded payment from
+    calculate_monthly_payment:
+    
+        B(k) = P * [(1+r)^n - (1+r)^k] / [(1+r)^n - 1] - d * [(1+r)^k - 1] / r
+    
+    Where d is the rounding difference between the charged and the exact
+    payment. Each balance is rounded to the cent, principal is the change in
+    balance and interest is the remainder of the payment, so every row
+    reconciles exactly. The final payment is adjusted to clear the loan.
+    
+    At high rates over long terms a payment rounded down by a fraction of a
+    cent no longer amortizes: the shortfall compounds into a balance larger
+    than a regular payment at the end of the term. The payment is then
+    rounded up to the next cent instead, so there is no balloon row.
+    
+    Args:
+        principal: Loan principal amount
+        annual_rate: Annual interest rate (as decimal)
+        term_years: Loan term in years
+    
+    Returns:
+        Dict of int64 arrays: period, payment, interest, principal, balance
+    """
+    payment = calculate_monthly_payment(principal, annual_rate, term_years)
+    monthly_rate = annual_rate / 12
+    num_payments = term_years * 12
+    periods = np.arange(1, num_payments + 1, dtype=np.float64)
+    
+    if annual_rate == 0:
+        balance = principal - payment * periods
+    else:
+        growth = np.power(1 + monthly_rate, periods)
+        total_growth = math.pow(1 + monthly_rate, num_payments)
+        exact_payment = principal * (
+            monthly_rate * total_growth
+        ) / (total_growth - 1)
+        shortfall = (exact_payment - payment) * (total_growth - 1) / monthly_rate
+        if shortfall > payment:
+            payment = math.ceil(exact_payment * 100 - 1e-6) / 100
+        balance = (
+            principal * (total_growth - growth) / (total_growth - 1)
+            - (payment - exact_payment) * (growth - 1) / monthly_rate
+        )
+    
+    balance_cents = np.rint(balance * 100).astype(np.int64)
+    
+    # The schedule ends at the first period that clears the loan
+    cleared = np.flatnonzero(balance_cents <= 0)
+    last = int(cleared[0]) if cleared.size else num_payments - 1
+    balance_cents = balance_cents[:last + 1]
+    balance_cents[last] = 0
+    
+    opening = np.concatenate(([round(principal * 100)], balance_cents[:-1]))
+    principal_paid = opening - balance_cents
+    payments = np.full(last + 1, round(payment * 100), dtype=np.int64)
+    
+    # Final payment covers the remaining balance plus its interest
+    payments[last] = opening[last] + round(int(opening[last]) * monthly_rate)
+    
+    return {
+        "period": np.arange(1, last + 2, dtype=np.int64),
+        "payment": payments,
+        "interest": payments - principal_paid,
+        "principal": principal_paid,
+        "balance": balance_cents
+    }
+
+
+def format_currency(amount: float, currency: str = "TTD") -> str:
+    """
+    Format amount as currency string.
+    
+    Args:
+        amount: Numeric amount
+        currency: Currency code (TTD or USD)
+    
+    Returns:
+        Formatted string (e.g., "TTD $1,234.56")
+    """
+    return f"{currency} ${amount:,.2f}"
+
+# ============================================================================
+# INVERSE SOLVER
+# ============================================================================
+
+# Bisection steps for rate solving; halves the bracket each time
+SOLVER_ITERATIONS = 64
+
+# Bounds on solved values, matching AffordabilityInput so every answer
+# can be posted back to /api/calculate
+MAX_TERM_YEARS = 50
+MAX_ANNUAL_RATE = 0.50
+MIN_ANNUAL_RATE = 0.001
+MAX_GROSS_MONTHLY_INCOME = 1_000_000
+
+
+def solve_max_rates(
+    target: np.ndarray,
+    affordable_payment: np.ndarray,
+    term_years: np.ndarray
+) -> np.ndarray:
+    """
+    Highest annual rate at which each payment still carries its target loan.
+    
+    Max loan falls monotonically with rate, so a bisection over the whole
+    batch converges together. The bracket starts at [0, 12 * PMT / target]:
+    above that rate the interest alone exceeds the payment.
+    
+    Args:
+        target: Loan amounts to cover
+        affordable_payment: Monthly payments available
+        term_years: Loan terms in years
+    
+    Returns:
+        Annual rates (as decimals), NaN where even 0% falls short
+    """
+    lo = np.zeros_like(target)
+    hi = 12 * affordable_payment / target
+    
+    for _ in range(SOLVER_ITERATIONS):
+        mid = (lo + hi) / 2
+        covers = calculate_max_loans(affordable_payment, mid, term_years) >= target
+        lo = np.where(covers, mid, lo)
+        hi = np.where(covers, hi, mid)
+    
+    reachable = affordable_payment * term_years * 12 >= target
+    return np.where(reachable, lo, np.nan)
+
+
+def solve_min_terms(
+    target: np.ndarray,
+    affordable_payment: np.ndarray,
+    annual_rate: np.ndarray
+) -> np.ndarray:
+    """
+    Shortest whole-year term over which each payment carries its target loan.
+    
+    Solves PV = PMT * [1 - (1+r)^(-n)] / r for n in closed form, then rounds
+    up to whole years.
+    
+    Args:
+        target: Loan amounts to cover
+        affordable_payment: Monthly payments available
+        annual_rate: Annual interest rates (as decimals)
+    
+    Returns:
+        Terms in years, NaN where no term up to MAX_TERM_YEARS is enough
+    """
+    monthly_rate = annual_rate / 12
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months = -np.log1p(-target * monthly_rate / affordable_payment) / np.log1p(monthly_rate)
+    months = np.where(annual_rate == 0, target / affordable_payment, months)
+    
+    years = np.maximum(1, np.ceil(months / 12 - 1e-9))
+    # Guard against the closed form landing a hair under the true boundary
+    with np.errstate(invalid="ignore"):
+        years = years + (calculate_max_loans(affordable_payment, annual_rate, years) < target)
+    
+    return np.where(np.isfinite(years) & (years <= MAX_TERM_YEARS), years, np.nan)
+
+
+def solve_scenarios(items: List[SolveRequest]) -> Tuple[Dict[str, np.ndarray], List[Optional[str]]]:
+    """
+    Fill in the solved parameter for requests that share solve_for.
+    
+    Income is rounded up and obligations down to the cent, and rates down
+    to 1e-6, so every answer still qualifies after rounding. Rates are
+    capped at MAX_ANNUAL_RATE; answers outside the AffordabilityInput
+    bounds are reported as unreachable.
+    
+    Args:
+        items: Validated requests, all with the same solve_for
+    
+    Returns:
+        Completed scenario columns, and a reason per item where no
+        qualifying value exists (None otherwise)
+    """
+    def column(name: str) -> np.ndarray:
+        return np.array(
+            [np.nan if getattr(r, name) is None else getattr(r, name) for r in items],
+            dtype=np.float64
+        )
+    
+    solve_for = items[0].solve_for
+    target = column("target_loan_amount")
+    scenario = {
+        name: column(name) for name in (
+            "gross_monthly_income", "dsr_ratio", "monthly_obligations",
+            "annual_interest_rate", "term_years"
+        )
+    }
+    income, dsr, obligations = (
+        scenario["gross_monthly_income"], scenario["dsr_ratio"], scenario["monthly_obligations"]
+    )
+    stress = column("stress_rate_bps") / 10000
+    reasons: List[Optional[str]] = [None] * len(items)
+    
+    if solve_for in ("gross_monthly_income", "monthly_obligations"):
+        qualifying_rate = scenario["annual_interest_rate"] + stress
+        term = scenario["term_years"]
+        payment = calculate_monthly_payments(target, qualifying_rate, term)
+        
+        if solve_for == "gross_monthly_income":
+            income = np.ceil((payment + obligations) / dsr * 100 - 1e-6) / 100
+            short = calculate_max_loans(income * dsr - obligations, qualifying_rate, term) < target
+            income = income + short * 0.01
+            scenario["gross_monthly_income"] = income
+            for index in np.flatnonzero(income > MAX_GROSS_MONTHLY_INCOME).tolist():
+                reasons[index] = (
+                    f"Target loan needs more than {MAX_GROSS_MONTHLY_INCOME:,} gross monthly income"
+                )
+        else:
+            obligations = np.floor((income * dsr - payment) * 100 + 1e-6) / 100
+            short = calculate_max_loans(income * dsr - obligations, qualifying_rate, term) < target
+            obligations = obligations - short * 0.01
+            scenario["monthly_obligations"] = obligations
+            for index in np.flatnonzero(obligations < 0).tolist():
+                reasons[index] = "Income does not cover the target loan even with no obligations"
+        return scenario, reasons
+    
+    affordable = income * dsr - obligations
+    for index in np.flatnonzero(affordable <= 0).tolist():
+        reasons[index] = "Monthly obligations exceed affordable debt service"
+    affordable = np.where(affordable > 0, affordable, np.nan)
+    
+    if solve_for == "annual_interest_rate":
+        qualifying_rate = solve_max_rates(target, affordable, scenario["term_years"])
+        # Any rate up to the model's ceiling qualifies beyond this point
+        rate = np.minimum(np.floor((qualifying_rate - stress) * 1e6) / 1e6, MAX_ANNUAL_RATE)
+        scenario["annual_interest_rate"] = rate
+        for index in np.flatnonzero(~(rate > MIN_ANNUAL_RATE)).tolist():
+            reasons[index] = reasons[index] or (
+                f"Target loan is not reachable at a rate above {MIN_ANNUAL_RATE:.1%} "
+                "after stress over this term"
+            )
+    else:
+        years = solve_min_terms(target, affordable, scenario["annual_interest_rate"] + stress)
+        scenario["term_years"] = years
+        for index in np.flatnonzero(np.isnan(years)).tolist():
+            reasons[index] = reasons[index] or (
+                f"Target loan is not reachable within {MAX_TERM_YEARS} years at this rate after stress"
+            )
+    
+    return scenario, reasons
+
+# ============================================================================
+# PORTFOLIO STRESS
+# ============================================================================
+
+# Loans parsed and stressed per vectorized step
+PORTFOLIO_CHUNK_ROWS = int(os.environ.get("PORTFOLIO_CHUNK_ROWS", 50_000))
+
+# Upload bytes held in memory before spilling to a temporary file
+PORTFOLIO_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Largest accepted upload; bigger bodies get 413
+PORTFOLIO_MAX_UPLOAD_BYTES = int(os.environ.get("PORTFOLIO_MAX_UPLOAD_BYTES", 512 * 1024 * 1024))
+
+# Upload bytes gathered before each spool write, which runs off the event loop
+PORTFOLIO_WRITE_BYTES = 1024 * 1024
+
+PORTFOLIO_REQUIRED_COLUMNS = ("principal", "annual_interest_rate", "remaining_term_months")
+PORTFOLIO_OPTIONAL_COLUMNS = ("loan_id", "gross_monthly_income", "monthly_obligations")
+
+
+class PortfolioTotals:
+    """
+    Running aggregates for a portfolio stress run, one entry per scenario.
+    
+    Scenario 0 bps is the unstressed book. DSR counts only cover loans with
+    a gross_monthly_income.
+    """
+    
+    SUMMARY_FIELDS = (
+        "scenario_bps", "loans", "total_base_payment", "total_stress_payment",
+        "total_payment_shock", "payment_shock_percent", "loans_with_income",
+        "loans_above_dsr", "share_above_dsr", "rows_skipped"
+    )
+    
+    def __init__(self, stress_bps: List[int], dsr_threshold: float):
+        self.scenarios = [0] + [bps for bps in stress_bps if bps]
+        self.dsr_threshold = dsr_threshold
+        self.loans = 0
+        self.rows_skipped = 0
+        self.loans_with_income = 0
+        self.base_total = 0.0
+        self.stress_totals = [0.0] * len(self.scenarios)
+        self.above_dsr = [0] * len(self.scenarios)
+    
+    def summary(self) -> List[dict]:
+        """One aggregate row per scenario."""
+        rows = []
+        for bps, stress_total, above in zip(self.scenarios, self.stress_totals, self.above_dsr):
+            shock = stress_total - self.base_total
+            rows.append({
+                "scenario_bps": bps,
+                "loans": self.loans,
+                "total_base_payment": round(self.base_total, 2),
+                "total_stress_payment": round(stress_total, 2),
+                "total_payment_shock": round(shock, 2),
+                "payment_shock_percent": round(shock / self.base_total * 100, 4) if self.base_total else 0.0,
+                "loans_with_income": self.loans_with_income,
+                "loans_above_dsr": above,
+                "share_above_dsr": round(above / self.loans_with_income, 6) if self.loans_with_income else 0.0,
+                "rows_skipped": self.rows_skipped
+            })
+        return rows
+
+
+def read_portfolio_header(reader: Iterator[List[str]]) -> Dict[str, int]:
+    """
+    Map portfolio column names to their positions.
+    
+    Raises:
+        ValueError: The file is empty or a required column is missing
+    """
+    header = next(reader, None)
+    if not header:
+        raise ValueError("Portfolio CSV is empty")
+    
+    positions = {name.strip().lower(): i for i, name in enumerate(header)}
+    missing = [name for name in PORTFOLIO_REQUIRED_COLUMNS if name not in positions]
+    if missing:
+        raise ValueError(f"Portfolio CSV is missing columns: {', '.join(missing)}")
+    
+    return {
+        name: positions[name]
+        for name in PORTFOLIO_REQUIRED_COLUMNS + PORTFOLIO_OPTIONAL_COLUMNS
+        if name in positions
+    }
+
+
+def stress_portfolio(
+    reader: Iterator[List[str]],
+    columns: Dict[str, int],
+    totals: PortfolioTotals,
+    emit_rows: bool = True,
+    chunk_rows: int = PORTFOLIO_CHUNK_ROWS
+) -> Iterator[str]:
+    """
+    Stress a loan book chunk by chunk and yield CSV text.
+    
+    Each chunk is parsed into arrays and every scenario's payment is
+    computed in one array pass, applying the same shock as
+    _calculate_payment_stress_test. Only one chunk is held at a time, so
+    memory does not grow with the file. After the loan rows, a blank line
+    and a per-scenario summary table follow.
+    
+    Args:
+        reader: CSV rows after the header
+        columns: Column positions from read_portfolio_header
+        totals: Aggregates, updated as chunks are processed
+        emit_rows: Yield per-loan rows (False only accumulates totals)
+        chunk_rows: Loans per vectorized step
+    
+    Returns:
+        Iterator of CSV text blocks
+    """
+    has_income = "gross_monthly_income" in columns
+    stressed = totals.scenarios[1:]
+    
+    if emit_rows:
+        header = ["loan_id", "principal", "annual_interest_rate", "remaining_term_months",
+                  "status", "base_payment"]
+        for bps in stressed:
+            header += [f"stress_payment_{bps}bps", f"payment_shock_{bps}bps"]
+        if has_income:
+            header += [f"dsr_{bps}bps" for bps in totals.scenarios]
+        yield ",".join(header) + "\n"
+    
+    first_row = 0
+    while True:
+        rows = [row for _, row in zip(range(chunk_rows), reader)]
+        if not rows:
+            break
+        block = _stress_portfolio_chunk(rows, first_row, columns, totals, emit_rows)
+        first_row += len(rows)
+        if emit_rows:
+            yield block
+    
+    if emit_rows:
+        lines = ["", ",".join(PortfolioTotals.SUMMARY_FIELDS)]
+        for entry in totals.summary():
+            lines.append(",".join(str(entry[name]) for name in PortfolioTotals.SUMMARY_FIELDS))
+        yield "\n".join(lines) + "\n"
+
+
+def _portfolio_column(rows: List[List[str]], position: Optional[int]) -> np.ndarray:
+    """Parse one CSV column as floats; blank or malformed cells become NaN."""
+    if position is None:
+        return np.full(len(rows), np.nan)
+    
+    cells = [row[position] if position < len(row) else "" for row in rows]
+    try:
+        return np.array(cells, dtype=np.float64)
+    except ValueError:
+        values = np.empty(len(cells))
+        for i, cell in enumerate(cells):
+            try:
+                values[i] = float(cell)
+            except ValueError:
+                values[i] = np.nan
+        return values
+
+
+def _stress_portfolio_chunk(
+    rows: List[List[str]],
+    first_row: int,
+    columns: Dict[str, int],
+    totals: PortfolioTotals,
+    emit_rows: bool
+) -> str:
+    """Stress one chunk of loans, update totals, and return its CSV rows."""
+    principal = _portfolio_column(rows, columns["principal"])
+    rates = _portfolio_column(rows, columns["annual_interest_rate"])
+    months = _portfolio_column(rows, columns["remaining_term_months"])
+    income = _portfolio_column(rows, columns.get("gross_monthly_income"))
+    obligations = np.nan_to_num(_portfolio_column(rows, columns.get("monthly_obligations")))
+    
+    with np.errstate(invalid="ignore"):
+        valid = (
+            (principal > 0) & (rates >= 0) & (rates <= 1)
+            & (months >= 1) & (months == np.floor(months))
+        )
+        with_income = valid & (income > 0)
+    
+    # Scenario 0 is the base payment; rows are scenarios, columns are loans
+    bps = np.array(totals.scenarios, dtype=np.float64)[:, None]
+    payments = np.round(
+        calculate_monthly_payments(principal, rates + bps / 10000, months / 12), 2
+    )
+    payments[:, ~valid] = np.nan
+    
+    totals.loans += int(valid.sum())
+    totals.rows_skipped += int((~valid).sum())
+    totals.loans_with_income += int(with_income.sum())
+    totals.base_total += float(payments[0, valid].sum())
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dsr = (payments + obligations) / income
+    for k in range(len(totals.scenarios)):
+        totals.stress_totals[k] += float(payments[k, valid].sum())
+        totals.above_dsr[k] += int((dsr[k, with_income] > totals.dsr_threshold).sum())
+    
+    if not emit_rows:
+        return ""
+    
+    # One numeric tail per loan: base, then (stressed, shock) per scenario, then DSRs
+    shocks = payments[1:] - payments[0]
+    tails = np.vstack([payments[:1], np.stack([payments[1:], shocks], axis=1).reshape(-1, len(rows))])
+    tail_format = ",".join(["ok"] + ["%.2f"] * len(tails))
+    dsr_format = ",%.4f" * len(totals.scenarios)
+    if "gross_monthly_income" in columns:
+        tails = np.vstack([tails, dsr])
+        blank_dsr = "," * len(totals.scenarios)
+    else:
+        dsr_format = blank_dsr = ""
+    blank_tail = "invalid" + "," * tail_format.count(",") + blank_dsr
+    per_loan = tails.T.tolist()
+    split = len(tails) - len(dsr) if dsr_format else len(tails)
+    
+    id_position = columns.get("loan_id")
+    input_positions = [columns[name] for name in PORTFOLIO_REQUIRED_COLUMNS]
+    out = []
+    for i, row in enumerate(rows):
+        if id_position is not None and id_position < len(row):
+            loan_id = row[id_position]
+        else:
+            loan_id = str(first_row + i + 1)
+        fields = [loan_id] + [row[p] if p < len(row) else "" for p in input_positions]
+        prefix = ",".join(_csv_field(field) for field in fields)
+        
+        # Skipped loans and loans without income leave their trailing columns blank
+        if not valid[i]:
+            out.append(f"{prefix},{blank_tail}")
+        elif with_income[i] and dsr_format:
+            out.append(f"{prefix},{(tail_format + dsr_format) % tuple(per_loan[i])}")
+        else:
+            out.append(f"{prefix},{tail_format % tuple(per_loan[i][:split])}{blank_dsr}")
+    
+    return "\n".join(out) + "\n"
+
+
+def _csv_field(value: str) -> str:
+    """Quote a CSV field if it needs it."""
+    if "," in value or '"' in value or "\n" in value or "\r" in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+# ============================================================================
+# RATE SIMULATION
+# ============================================================================
+
+def simulate_rate_paths(
+    initial_rate: float,
+    paths: int,
+    periods: int,
+    period_years: float,
+    mean_reversion: float,
+    volatility: float,
+    long_run_rate: float,
+    rate_floor: float,
+    rate_cap: float,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Sample mean-reverting annual rate paths observed once per reset period.
+    
+    Uses the exact Ornstein-Uhlenbeck transition over each period, so the
+    distribution does not depend on how often rates reset. Rates are
+    clipped to [rate_floor, rate_cap] after each step.
+    
+    Args:
+        initial_rate: Rate fixed for the first period
+        paths: Number of paths
+        periods: Number of reset periods, including the first
+        period_years: Length of one reset period in years
+        mean_reversion: Annual reversion speed (0 for a random walk)
+        volatility: Annual volatility in absolute rate terms
+        long_run_rate: Level the rate reverts to
+        rate_floor: Lowest allowed rate
+        rate_cap: Highest allowed rate
+        rng: Random generator
+    
+    Returns:
+        Array of shape (periods, paths) with the rate for each period
+    """
+    if mean_reversion > 0:
+        decay = math.exp(-mean_reversion * period_years)
+        step_sd = volatility * math.sqrt((1 - decay * decay) / (2 * mean_reversion))
+    else:
+        decay = 1.0
+        step_sd = volatility * math.sqrt(period_years)
+    
+    shocks = rng.standard_normal((periods, paths))
+    shocks *= step_sd
+    
+    rates = np.empty((periods, paths))
+    rates[0] = initial_rate
+    for period in range(1, periods):
+        drifted = long_run_rate + (rates[period - 1] - long_run_rate) * decay
+        np.clip(drifted + shocks[period], rate_floor, rate_cap, out=rates[period])
+    return rates
+
+
+def simulate_payments(
+    principal: float,
+    term_months: int,
+    reset_months: int,
+    rates: np.ndarray
+) -> np.ndarray:
+    """
+    Re-amortize a loan at every reset along each simulated rate path.
+    
+    At each reset the outstanding balance is spread over the remaining
+    months at the new rate, as an adjustable-rate loan would be repriced.
+    
+    Args:
+        principal: Loan principal
+        term_months: Original term in months
+        reset_months: Months between resets
+        rates: Annual rates of shape (periods, paths)
+    
+    Returns:
+        Monthly payment of shape (periods, paths) for each reset period
+    """
+    periods, paths = rates.shape
+    payments = np.empty((periods, paths))
+    balance = np.full(paths, float(principal))
+    
+    for period in range(periods):
+        remaining = term_months - period * reset_months
+        elapsed = min(reset_months, remaining)
+        monthly_rate = rates[period] / 12
+        zero = monthly_rate == 0
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.power(1 + monthly_rate, remaining)
+            payment = balance * monthly_rate * growth / (growth - 1)
+            payment = np.where(zero, balance / remaining, payment)
+            
+            # Balance left after this period's payments
+            accrued = np.power(1 + monthly_rate, elapsed)
+            balance = np.where(
+                zero,
+                balance - payment * elapsed,
+                balance * accrued - payment * (accrued - 1) / monthly_rate
+            )
+        payments[period] = payment
+    
+    return payments
+
+
+def simulation_percentiles(values: np.ndarray, percentiles: List[float]) -> np.ndarray:
+    """
+    Percentiles across paths (the last axis) with linear interpolation.
+    
+    Same values as np.percentile's default method, but one full sort is
+    several times faster than its multi-kth partition on wide arrays.
+    
+    Returns:
+        Array with one leading row per requested percentile
+    """
+    ordered = np.sort(values, axis=-1)
+    positions = np.asarray(percentiles, dtype=np.float64) / 100 * (ordered.shape[-1] - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, ordered.shape[-1] - 1)
+    fraction = positions - lower
+    
+    below = np.moveaxis(ordered[..., lower], -1, 0)
+    above = np.moveaxis(ordered[..., upper], -1, 0)
+    fraction = fraction.reshape((-1,) + (1,) * (values.ndim - 1))
+    return below + (above - below) * fraction
+
+
+def _percentile_bands(values: np.ndarray, percentiles: List[float], decimals: int) -> Dict[str, Any]:
+    """Label rows from simulation_percentiles as p5, p50 and so on, rounded."""
+    return {
+        _percentile_label(q): np.round(band, decimals).tolist()
+        for q, band in zip(percentiles, values)
+    }
+
+
+def _percentile_label(q: float) -> str:
+    """Label a percentile as p5, p50, p97.5 and so on."""
+    return f"p{q:g}"
+
+# ============================================================================
+# CALCULATION CACHE
+# ============================================================================
+
+class CalculationCache:
+    """
+    Bounded LRU cache with a per-entry TTL for calculation results.
+    
+    Only used from the event loop thread, so it needs no locking. Cached
+    values are shared between responses and must not be mutated.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+    
+    def get(self, key: tuple) -> Optional[dict]:
+        """Return a fresh cached value, counting the hit or miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+    
+    def put(self, key: tuple, value: dict) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+calculation_cache = CalculationCache(CALC_CACHE_SIZE, CALC_CACHE_TTL_SECONDS)
+
+
+def _calculation_cache_key(request: CalculationRequest) -> tuple:
+    """
+    Key a request by the inputs that determine its financial results.
+    
+    Applicant details, validity and therefore certificate ID and dates are
+    left out; they are added fresh to every response.
+    """
+    if request.calculation_type == "AFFORDABILITY":
+        inp = request.affordability_input
+    else:
+        inp = request.payment_input
+    
+    if inp is None:
+        return (request.calculation_type, request.currency, None)
+    
+    # A missing stress shock behaves exactly like zero
+    fields = inp.model_dump()
+    fields["stress_rate_bps"] = fields["stress_rate_bps"] or 0
+    return (request.calculation_type, request.currency, *fields.values())
+
+# ============================================================================
+# CERTIFICATE SIGNING
+# ============================================================================
+
+# Token layout version, the first payload field
+CERT_TOKEN_VERSION = "1"
+
+# Signature bytes kept in a token (128 bits)
+CERT_TOKEN_SIGNATURE_BYTES = 16
+
+# Key figures carried in a token, by calculation type (dotted paths into the result)
+CERT_TOKEN_FIGURES = {
+    "AFFORDABILITY": ("max_loan_amount", "stress_test.stress_max_loan"),
+    "PAYMENT": ("principal_amount", "monthly_payment", "stress_test.stress_monthly_payment")
+}
+
+
+def check_signing_key() -> None:
+    """
+    Refuse to serve several workers without a shared CERT_SIGNING_KEY.
+    
+    Each worker would sign with its own random key, so tokens issued by
+    one worker fail verification on the others. A single worker only
+    gets a warning, as its tokens still stop verifying after a restart.
+    
+    Raises:
+        RuntimeError: If WEB_CONCURRENCY > 1 and no key is configured
+    """
+    if CERT_SIGNING_KEY_CONFIGURED:
+        return
+    if WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"CERT_SIGNING_KEY must be set when serving with {WEB_CONCURRENCY} workers; "
+            "without it each worker signs certificates with its own random key"
+        )
+    logger.warning(
+        "CERT_SIGNING_KEY is not set: certificates are signed with a random key "
+        "that changes on restart and is not shared with other instances, so their "
+        "verification tokens will fail to verify there"
+    )
+
+
+@app.on_event("startup")
+async def check_signing_key_on_startup():
+    """Check the signing key configuration before serving requests."""
+    check_signing_key()
+
+
+def sign_certificate(result: dict) -> str:
+    """
+    Build the verification token for a calculation result.
+    
+    The payload is a short "|"-separated record (version, certificate ID,
+    issue and expiry dates, type, currency and key figures in cents) that
+    is base64url encoded and followed by a truncated HMAC-SHA256 of it, so
+    the token fits on one line of the certificate.
+    
+    Args:
+        result: Result as returned by /api/calculate
+    
+    Returns:
+        Token of the form "<payload>.<signature>"
+    """
+    figures = []
+    for path in CERT_TOKEN_FIGURES[result["calculation_type"]]:
+        value = result
+        for key in path.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        figures.append("" if value is None else str(round(value * 100)))
+    
+    payload = "|".join([
+        CERT_TOKEN_VERSION,
+        result["certificate_id"],
+        result["issue_date"].replace("-", ""),
+        result["expiry_date"].replace("-", ""),
+        result["calculation_type"][0],
+        result["currency"],
+        *figures
+    ]).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_token_signature(CERT_SIGNING_KEY, payload))}"
+
+
+def verify_certificate_token(token: str) -> dict:
+    """
+    Check a verification token using only the signing keys in memory.
+    
+    Args:
+        token: Token printed on a certificate
+    
+    Returns:
+        "valid", a "reason" when invalid (malformed, bad_signature or
+        expired), and the decoded "certificate" when the signature holds
+    """
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        return {"valid": False, "reason": "malformed", "certificate": None}
+    
+    if not any(
+        hmac.compare_digest(signature, _token_signature(key, payload))
+        for key in (CERT_SIGNING_KEY, *CERT_SIGNING_PREVIOUS_KEYS)
+    ):
+        return {"valid": False, "reason": "bad_signature", "certificate": None}
+    
+    fields = payload.decode().split("|")
+    calculation_type = "AFFORDABILITY" if fields[4] == "A" else "PAYMENT"
+    certificate = {
+        "certificate_id": fields[1],
+        "issue_date": _token_date(fields[2]),
+        "expiry_date": _token_date(fields[3]),
+        "calculation_type": calculation_type,
+        "currency": fields[5]
+    }
+    for path, cents in zip(CERT_TOKEN_FIGURES[calculation_type], fields[6:]):
+        certificate[path.rpartition(".")[2]] = int(cents) / 100 if cents else None
+    
+    if certificate["expiry_date"] < date.today().isoformat():
+        return {"valid": False, "reason": "expired", "certificate": certificate}
+    return {"valid": True, "reason": None, "certificate": certificate}
+
+
+def _token_signature(key: bytes, payload: bytes) -> bytes:
+    return hmac.new(key, payload, hashlib.sha256).digest()[:CERT_TOKEN_SIGNATURE_BYTES]
+
+
+def _token_date(compact: str) -> str:
+    return f"{compact[:4]}-{compact[4:6]}-{compact[6:]}"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    """Decode unpadded base64url; raises ValueError on bad input."""
+    if not re.fullmatch(r"[A-Za-z0-9_-]*", text):
+        raise ValueError("Invalid base64url")
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+# ============================================================================
 # PDF GENERATION
 # ============================================================================
 
-def generate_certificate_pdf(cert_data: dict) -> str:
+def generate_certificate_pdf(cert_data: dict) -> str:
+    """
+    Generate PDF certificate with pre-qualification results and save it.
+    
+    Args:
+        cert_data: Dictionary containing certificate information
+    
+    Returns:
+        File path to generated PDF
+    """
+    return save_certificate_pdf(
+        cert_data['certificate_id'], render_certificate_pdf(cert_data)
+    )
+
+
+def render_certificate_pdf(
+    cert_data: dict,
+    use_template: bool = True,
+    timings: Optional[Dict[str, float]] = None
+) -> bytes:
+    """
+    Render PDF certificate into memory.
+    
+    The static layer (header, section titles, results box, fixed disclaimer
+    lines, footer) is drawn once per layout and cached as PDF operators; each
+    render replays it and draws only the per-certificate fields.
+    
+    Args:
+        cert_data: Dictionary containing certificate information
+        use_template: Replay the cached static layer instead of redrawing it
+        timings: If given, receives pdf_draw and pdf_save durations in seconds
+    
+    Returns:
+        PDF document bytes
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    
+    # Create PDF canvas; invariant mode fixes the creation date and document
+    # ID, so equal data renders to byte-identical files (and stable ETags)
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    
+    if use_template:
+        _register_fonts(c)
+        c.saveState()
+        c.addLiteral(_static_layer(_layout_key(cert_data)))
+        c.restoreState()
+        _draw_certificate(CertificateLayers(_NULL_CANVAS, c), cert_data)
+    else:
+        _draw_certificate(CertificateLayers(c, c), cert_data)
+    
+    drawn = time.perf_counter()
+    c.save()
+    
+    if timings is not None:
+        timings["pdf_draw"] = drawn - started
+        timings["pdf_save"] = time.perf_counter() - drawn
+    return buffer.getvalue()
+
+
+def _render_certificate_timed(pdf_data: dict) -> Tuple[bytes, Dict[str, float]]:
+    """Render in a pool worker and return the stage timings with the bytes."""
+    timings: Dict[str, float] = {}
+    return render_certificate_pdf(pdf_data, timings=timings), timings
+
+
+def save_certificate_pdf(cert_id: str, pdf_bytes: bytes) -> str:
+    """
+    Write rendered certificate bytes to PDF_DIR.
+    
+    Args:
+        cert_id: Certificate identifier used as the file name
+        pdf_bytes: Rendered PDF document
+    
+    Returns:
+        File path to saved PDF
+    """
+    filepath = certificate_pdf_path(cert_id)
+    filepath.write_bytes(pdf_bytes)
+    return str(filepath)
+
+
+# Certificate IDs as issued by _base_result: 8 upper-case hex digits of a uuid4
+CERTIFICATE_ID_PATTERN = re.compile(r"[0-9A-F]{8}")
+
+
+def certificate_pdf_path(cert_id: str) -> Path:
+    """
+    Return the file a certificate's PDF is persisted to in PDF_DIR.
+    
+    Raises:
+        ValueError: If the ID was not issued by us or the path leaves PDF_DIR
+    """
+    if not isinstance(cert_id, str) or not CERTIFICATE_ID_PATTERN.fullmatch(cert_id):
+        raise ValueError(f"Invalid certificate ID: {cert_id!r}")
+    
+    root = PDF_DIR.resolve()
+    filepath = (root / f"{cert_id}.pdf").resolve()
+    if filepath.parent != root:
+        raise ValueError(f"Invalid certificate ID: {cert_id!r}")
+    return filepath
+
+
+class CertificateLayers(NamedTuple):
+    """Drawing targets for the parts of a certificate that never change and those that do."""
+    static: Any
+    dynamic: Any
+
+
+class _NullCanvas:
+    """Canvas stand-in that discards drawing calls for a skipped layer."""
+    
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        return _discard
+
+
+def _discard(*args, **kwargs) -> None:
+    """Ignore a drawing call."""
+    return None
+
+
+_NULL_CANVAS = _NullCanvas()
+
+# Static layer PDF operators, keyed by layout (see _layout_key)
+_STATIC_LAYERS: Dict[Tuple[str, bool, bool], str] = {}
+
+
+def _layout_key(cert_data: dict) -> Tuple[str, bool, bool]:
+    """Return the fields that move static elements on the page."""
+    return (
+        cert_data['calculation_type'],
+        bool(cert_data.get('applicant_email')),
+        bool(cert_data.get('stress_results'))
+    )
+
+
+def _register_fonts(c: "Canvas") -> None:
+    """Register fonts in a fixed order so cached operators resolve to the same font names."""
+    c.setFont("Helvetica-Bold", 10)
+    c.setFont("Helvetica", 10)
+
+
+def _static_layer(key: Tuple[str, bool, bool]) -> str:
+    """Return cached static layer operators for a layout, drawing them on first use."""
+    operators = _STATIC_LAYERS.get(key)
+    if operators is None:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+        
+        calc_type, has_email, has_stress = key
+        
+        # Only the layout fields matter; every other field reads as blank
+        layout_data = defaultdict(str, {
+            'calculation_type': calc_type,
+            'applicant_email': has_email,
+            'stress_results': has_stress
+        })
+        
+        scratch = canvas.Canvas(io.BytesIO(), pagesize=letter)
+        _register_fonts(scratch)
+        start = len(scratch._code)
+        _draw_certificate(CertificateLayers(scratch, _NULL_CANVAS), layout_data)
+        operators = "\n".join(scratch._code[start:])
+        _STATIC_LAYERS[key] = operators
+    
+    return operators
+
+
+def warm_up_pdf_engine() -> None:
+    """
+    Import ReportLab and cache every static layer ahead of the first render.
+    
+    Without this the first certificate in each process pays for both.
+    """
+    for name in BRAND_COLORS:
+        COLORS[name]
+    for calc_type in ("AFFORDABILITY", "PAYMENT"):
+        for has_email in (False, True):
+            for has_stress in (False, True):
+                _static_layer((calc_type, has_email, has_stress))
+
+
+def _draw_certificate(layers: CertificateLayers, cert_data: dict) -> None:
+    """Draw every certificate section onto its layer."""
+    from reportlab.lib.pagesizes import letter
+    
+    width, height = letter
+    
+    # Draw header
+    _draw_header(layers.static, width, height)
+    
+    # Draw certificate details
+    y_pos = height - 150
+    y_pos = _draw_certificate_info(layers, cert_data, y_pos, width)
+    y_pos = _draw_applicant_info(layers, cert_data, y_pos)
+    y_pos = _draw_results_section(layers, cert_data, y_pos, width)
+    y_pos = _draw_stress_test(layers, cert_data, y_pos)
+    y_pos = _draw_disclaimer(layers, cert_data, y_pos)
+    
+    if cert_data.get("verification_token"):
+        _draw_verification(layers.dynamic, cert_data, width)
+    
+    # Draw footer
+    _draw_footer(layers.static, width)
+
+
+def _draw_header(c: "Canvas", width: float, height: float) -> None:
+    """Draw certificate header with lime green background."""
+    c.setFillColor(COLORS["lime_green"])
+    c.rect(0, height - 120, width, 120, fill=1, stroke=0)
+    
+    c.setFillColor(COLORS["white"])
+    c.setFont("Helvetica-Bold", 32)
+    c.drawCentredString(width / 2, height - 60, "Pre-Qualification App")
+    
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(width / 2, height - 90, "Pre-Qualification Certificate")
+
+
+def _draw_certificate_info(
+    layers: CertificateLayers,
+    cert_data: dict,
+    y_pos: float,
+    width: float
+) -> float:
+    """Draw certificate ID and date information."""
+    c = layers.dynamic
+    c.setFillColor(COLORS["dark_green"])
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y_pos, f"Certificate ID: {cert_data['certificate_id']}")
+    c.drawRightString(width - 50, y_pos, f"Issue Date: {cert_data['issue_date']}")
+    c.drawRightString(width - 50, y_pos - 15, f"Expiry Date: {cert_data['expiry_date']}")
+    
+    return y_pos - 50
+
+
+def _draw_applicant_info(
+    layers: CertificateLayers,
+    cert_data: dict,
+    y_pos: float
+) -> float:
+    """Draw applicant information section."""
+    s, d = layers
+    s.setFont("Helvetica-Bold", 14)
+    s.setFillColor(COLORS["lime_green"])
+    s.drawString(50, y_pos, "Applicant Information")
+    
+    d.setFillColor(COLORS["dark_green"])
+    d.setFont("Helvetica", 11)
+    y_pos -= 25
+    d.drawString(70, y_pos, f"Name: {cert_data['applicant_name']}")
+    
+    if cert_data.get('applicant_email'):
+        y_pos -= 20
+        d.drawString(70, y_pos, f"Email: {cert_data['applicant_email']}")
+    
+    return y_pos - 40
+
+
+def _draw_results_section(
+    layers: CertificateLayers,
+    cert_data: dict,
+    y_pos: float,
+    width: float
+) -> float:
+    """Draw results box with calculation outcomes."""
+    s, d = layers
+    s.setFont("Helvetica-Bold", 14)
+    s.setFillColor(COLORS["lime_green"])
+    s.drawString(50, y_pos, "Assessment Results")
+    
+    # Draw results box
+    y_pos -= 30
+    s.setFillColor(COLORS["light_bg"])
+    s.rect(50, y_pos - 150, width - 100, 150, fill=1, stroke=1)
+    s.setStrokeColor(COLORS["lime_green"])
+    s.setLineWidth(2)
+    s.rect(50, y_pos - 150, width - 100, 150, fill=0, stroke=1)
+    
+    # Draw results text
+    d.setFillColor(COLORS["dark_green"])
+    d.setFont("Helvetica", 11)
+    y_pos -= 25
+    
+    calc_type = cert_data['calculation_type']
+    if calc_type == "AFFORDABILITY":
+        y_pos = _draw_affordability_results(d, cert_data, y_pos)
+    else:
+        y_pos = _draw_payment_results(d, cert_data, y_pos)
+    
+    # Common details
+    d.setFont("Helvetica", 11)
+    d.setFillColor(COLORS["dark_green"])
+    y_pos -= 25
+    d.drawString(70, y_pos, f"Annual Interest Rate: {cert_data['interest_rate']}%")
+    y_pos -= 20
+    d.drawString(70, y_pos, f"Loan Term: {cert_data['term_years']} years")
+    
+    return y_pos - 30
+
+
+def _draw_affordability_results(
+    c: "Canvas",
+    cert_data: dict,
+    y_pos: float
+) -> float:
+    """Draw affordability calculation results."""
+    c.drawString(70, y_pos, f"Gross Monthly Income: {cert_data['gross_income']}")
+    y_pos -= 20
+    c.drawString(70, y_pos, f"DSR Ratio: {cert_data['dsr_ratio']}%")
+    y_pos -= 20
+    c.drawString(70, y_pos, f"Monthly Obligations: {cert_data['monthly_obligations']}")
+    y_pos -= 20
+    c.drawString(70, y_pos, f"Affordable Monthly Payment: {cert_data['affordable_payment']}")
+    y_pos -= 25
+    
+    c.setFont("Helvetica-Bold", 14)
+    c.setFillColor(COLORS["lime_green"])
+    c.drawString(70, y_pos, f"Maximum Loan Amount: {cert_data['max_loan']}")
+    
+    return y_pos
+
+
+def _draw_payment_results(
+    c: "Canvas",
+    cert_data: dict,
+    y_pos: float
+) -> float:
+    """Draw payment calculation results."""
+    c.drawString(70, y_pos, f"Principal Loan Amount: {cert_data['principal_amount']}")
+    y_pos -= 25
+    
+    c.setFont("Helvetica-Bold", 14)
+    c.setFillColor(COLORS["lime_green"])
+    c.drawString(70, y_pos, f"Monthly Payment: {cert_data['monthly_payment']}")
+    
+    return y_pos
+
+
+def _draw_stress_test(
+    layers: CertificateLayers,
+    cert_data: dict,
+    y_pos: float
+) -> float:
+    """Draw stress test results if applicable."""
+    if not cert_data.get('stress_results'):
+        return y_pos
+    
+    c = layers.dynamic
+    y_pos -= 30
+    c.setFont("Helvetica-Bold", 12)
+    c.setFillColor(COLORS["warning"])
+    c.drawString(
+        70, y_pos,
+        f"Stress Test Results (+ {cert_data['stress_bps']} bps):"
+    )
+    
+    y_pos -= 20
+    c.setFont("Helvetica", 11)
+    c.drawString(70, y_pos, cert_data['stress_results'])
+    
+    return y_pos
+
+
+def _draw_disclaimer(
+    layers: CertificateLayers,
+    cert_data: dict,
+    y_pos: float
+) -> float:
+    """Draw disclaimer section."""
+    s, d = layers
+    y_pos -= 60
+    s.setFont("Helvetica-Bold", 12)
+    s.setFillColor(COLORS["lime_green"])
+    s.drawString(50, y_pos, "Important Disclaimer")
+    
+    y_pos -= 20
+    s.setFont("Helvetica", 9)
+    s.setFillColor(COLORS["dark_green"])
+    
+    # Only the validity line varies between certificates
+    disclaimer_lines = [
+        (s, "This pre-qualification certificate is an estimate only and does not constitute a loan approval or commitment."),
+        (s, "Final loan approval is subject to credit verification, property appraisal, and other lending criteria."),
+        (d, f"This certificate is valid for {cert_data['validity_days']} days from the issue date."),
+        (s, "Interest rates and terms are subject to change. Please consult with a loan officer for details.")
+    ]
+    
+    d.setFont("Helvetica", 9)
+    d.setFillColor(COLORS["dark_green"])
+    
+    for layer, line in disclaimer_lines:
+        layer.drawString(50, y_pos, line)
+        y_pos -= 15
+    
+    return y_pos
+
+
+def _draw_verification(c: "Canvas", cert_data: dict, width: float) -> None:
+    """Draw the signed verification code above the footer."""
+    c.setFont("Helvetica", 7)
+    c.setFillColor(COLORS["dark_green"])
+    c.drawCentredString(width / 2, 68, "Verify this certificate at /api/certificates/verify with the code:")
+    
+    c.setFont("Courier", 7)
+    c.drawCentredString(width / 2, 58, cert_data["verification_token"])
+
+
+def _draw_footer(c: "Canvas", width: float) -> None:
+    """Draw footer with branding."""
+    c.setFont("Helvetica-Bold", 10)
+    c.setFillColor(COLORS["lime_green"])
+    c.drawCentredString(width / 2, 40, "Pre-Qualification App - Your Mortgage Calculator")
+    
+    c.setFont("Helvetica", 8)
+    c.setFillColor(COLORS["dark_green"])
+    c.drawCentredString(width / 2, 25, "www.prequalificationapp.com")
+
+# ============================================================================
+# PDF RENDER POOL
+# ============================================================================
+
+class PDFRenderPool:
+    """
+    Runs render_certificate_pdf off the event loop.
+    
+    At most `workers` renders run at once and at most `queue_size` more wait
+    for a free worker. Submissions beyond that are rejected with 429 and a
+    Retry-After rather than piling up behind the executor's unbounded
+    internal queue.
+    """
+    
+    BACKENDS = ("process", "thread", "inline")
+    
+    def __init__(self, backend: str, workers: int, queue_size: int, warm_up: bool = False):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"PDF render backend must be one of {self.BACKENDS}")
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.warm = warm_up
+        self.pending = 0
+        self.rejected = 0
+        self.mean_seconds = 0.1
+        self._executor: Optional[Executor] = None
+    
+    def _get_executor(self) -> Executor:
+        """Create the executor on first use."""
+        if self._executor is None:
+            if self.backend == "process":
+                # spawn avoids forking a process that already runs event loop threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_up_pdf_engine if self.warm else None
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="pdf-render"
+                )
+        return self._executor
+    
+    async def render(self, pdf_data: dict, bounded: bool = True) -> bytes:
+        """
+        Render a certificate and return the PDF bytes.
+        
+        Args:
+            pdf_data: Prepared certificate fields
+            bounded: Apply the capacity check; callers with their own fixed
+                worker count (certificate jobs) pass False
+        """
+        # Only touched from the event loop thread, so a plain counter is enough
+        if bounded and self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Certificate renderer is at capacity, please retry",
+                headers={"Retry-After": str(retry_after_seconds(
+                    self.pending - self.workers, self.workers, self.mean_seconds
+                ))}
+            )
+        
+        self.pending += 1
+        if self.backend == "inline":
+            try:
+                # Already covered by the request's own profile, if any
+                pdf_bytes, timings = _render_certificate_timed(pdf_data)
+            finally:
+                self.pending -= 1
+        else:
+            try:
+                loop = asyncio.get_running_loop()
+                stem = _profile_stem.get()
+                if stem is None:
+                    task = loop.run_in_executor(
+                        self._get_executor(), _render_certificate_timed, pdf_data
+                    )
+                else:
+                    task = loop.run_in_executor(
+                        self._get_executor(), _render_certificate_profiled, pdf_data, stem
+                    )
+            except BaseException:
+                self.pending -= 1
+                raise
+            # A started render runs on after its request is cancelled, so the
+            # slot is freed when the executor finishes, not when we stop waiting
+            task.add_done_callback(self._release)
+            pdf_bytes, timings = await asyncio.shield(task)
+        
+        # Workers may be other processes, so stage timings come back with the result
+        for stage, seconds in timings.items():
+            STAGE_LATENCY.observe(stage, seconds)
+        self.mean_seconds += AdmissionGate.SMOOTHING * (sum(timings.values()) - self.mean_seconds)
+        return pdf_bytes
+    
+    def _release(self, task: asyncio.Future) -> None:
+        """Free the render's slot once the executor is done with it."""
+        self.pending -= 1
+        if not task.cancelled():
+            # Mark a failure as seen when nobody is left awaiting it
+            task.exception()
+    
+    async def warm_up(self) -> None:
+        """Load the PDF engine where renders will run, starting every worker process."""
+        if self.backend == "process":
+            # Workers spawn on demand; each runs warm_up_pdf_engine as its initializer
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            await asyncio.gather(*(
+                loop.run_in_executor(executor, os.getpid) for _ in range(self.workers)
+            ))
+        else:
+            await run_in_threadpool(warm_up_pdf_engine)
+    
+    def shutdown(self) -> None:
+        """Stop worker processes or threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+pdf_render_pool = PDFRenderPool(
+    PDF_RENDER_BACKEND, PDF_RENDER_WORKERS, PDF_RENDER_QUEUE_SIZE, warm_up=PDF_WARM_UP
+)
+
+
+@app.on_event("startup")
+async def warm_up_pdf_render_pool():
+    """Load ReportLab and certificate templates before the first render, if enabled."""
+    if PDF_WARM_UP:
+        await pdf_render_pool.warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown_pdf_render_pool():
+    """Release PDF render workers on shutdown."""
+    pdf_render_pool.shutdown()
+
+# ============================================================================
+# CERTIFICATE REGISTRY
+# ============================================================================
+
+class CertificateRegistry:
+    """
+    SQLite index of calculation results and rendered PDFs by certificate ID.
+    
+    Runs in WAL mode so reads never wait on the writer. Rows past their
+    expiry_date, and the oldest rows beyond max_entries, are removed by
+    sweep(), which also reclaims the freed pages so the file stays bounded.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS certificates (
+            certificate_id TEXT PRIMARY KEY,
+            expiry_date TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            result TEXT,
+            pdf BLOB
+        );
+        CREATE INDEX IF NOT EXISTS idx_certificates_expiry ON certificates (expiry_date);
+        CREATE INDEX IF NOT EXISTS idx_certificates_created ON certificates (created_at);
+    """
+    
+    def __init__(self, path: Path, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            # auto_vacuum must be set before the first table is created
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    def put_results(self, results: List[dict]) -> None:
+        """Index calculation results, keeping any PDF already stored."""
+        rows = [
+            (r["certificate_id"], r["expiry_date"], time.time(), json.dumps(r))
+            for r in results
+        ]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO certificates (certificate_id, expiry_date, created_at, result)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (certificate_id) DO UPDATE SET
+                        expiry_date = excluded.expiry_date,
+                        result = excluded.result
+                    """,
+                    rows
+                )
+    
+    def put_pdf(self, cert_id: str, expiry_date: str, pdf_bytes: bytes) -> None:
+        """Store a rendered PDF for a certificate; a PDF already stored is never replaced."""
+        if not CERTIFICATE_ID_PATTERN.fullmatch(cert_id):
+            raise ValueError(f"Invalid certificate ID: {cert_id!r}")
+        
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO certificates (certificate_id, expiry_date, created_at, pdf)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (certificate_id) DO UPDATE SET pdf = excluded.pdf
+                    WHERE certificates.pdf IS NULL
+                    """,
+                    (cert_id, expiry_date, time.time(), pdf_bytes)
+                )
+    
+    def get(self, cert_id: str) -> Optional[dict]:
+        """Return the unexpired entry for a certificate, or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT expiry_date, result, pdf FROM certificates "
+                "WHERE certificate_id = ? AND expiry_date >= ?",
+                (cert_id, date.today().isoformat())
+            ).fetchone()
+        
+        if row is None:
+            return None
+        return {
+            "expiry_date": row[0],
+            "result": json.loads(row[1]) if row[1] else None,
+            "pdf": row[2]
+        }
+    
+    def sweep(self) -> List[str]:
+        """Evict expired and over-capacity entries; return their IDs."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                evicted = [row[0] for row in conn.execute(
+                    "SELECT certificate_id FROM certificates WHERE expiry_date < ?",
+                    (date.today().isoformat(),)
+                )]
+                evicted += [row[0] for row in conn.execute(
+                    "SELECT certificate_id FROM certificates "
+                    "WHERE expiry_date >= ? ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (date.today().isoformat(), self.max_entries)
+                )]
+                conn.executemany(
+                    "DELETE FROM certificates WHERE certificate_id = ?",
+                    [(cert_id,) for cert_id in evicted]
+                )
+            
+            # Return freed pages to the filesystem and truncate the WAL
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        
+        # Drop persisted copies as well (see PDF_PERSIST)
+        for cert_id in evicted:
+            try:
+                filepath = certificate_pdf_path(cert_id)
+            except ValueError:
+                # Never written to disk, and must not name a file outside PDF_DIR
+                continue
+            try:
+                filepath.unlink(missing_ok=True)
+            except OSError as e:
+                # The row is gone, so keep going rather than strand the remaining files
+                logger.warning("Could not delete expired certificate PDF %s: %s", filepath, e)
+        
+        return evicted
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+certificate_registry = CertificateRegistry(CERT_REGISTRY_PATH, CERT_REGISTRY_MAX_ENTRIES)
+
+
+async def _sweep_certificates_forever() -> None:
+    """Periodically evict expired certificates from the registry."""
+    while True:
+        try:
+            await run_in_threadpool(certificate_registry.sweep)
+        except Exception:
+            # e.g. "database is locked"; the next sweep catches up
+            logger.exception("Certificate registry sweep failed")
+        await asyncio.sleep(CERT_SWEEP_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_certificate_sweeper():
+    """Start the registry expiry sweeper."""
+    app.state.certificate_sweeper = asyncio.create_task(_sweep_certificates_forever())
+
+
+@app.on_event("shutdown")
+async def stop_certificate_sweeper():
+    """Stop the sweeper and close the registry."""
+    app.state.certificate_sweeper.cancel()
+    certificate_registry.close()
+
+# ============================================================================
+# CERTIFICATE JOBS
+# ============================================================================
+
+class CertificateJob:
+    """State of one queued certificate render."""
+    
+    TERMINAL = ("done", "failed")
+    
+    def __init__(self, certificate_id: str, pdf_data: dict):
+        self.job_id = uuid.uuid4().hex
+        self.certificate_id = certificate_id
+        self.pdf_data: Optional[dict] = pdf_data
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Set and replaced on every status change, so waiters wake once per change
+        self.changed = asyncio.Event()
+    
+    def update(self, status: str, error: Optional[str] = None) -> None:
+        """Move to a new status and wake anyone waiting on the job."""
+        self.status = status
+        self.error = error
+        if status in self.TERMINAL:
+            self.finished_at = time.time()
+            self.pdf_data = None
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+    
+    def as_dict(self) -> dict:
+        """Public view of the job."""
+        base = f"/api/certificate-jobs/{self.job_id}"
+        return {
+            "job_id": self.job_id,
+            "certificate_id": self.certificate_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+            "finished_at": (
+                datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None
+            ),
+            "status_url": base,
+            "events_url": f"{base}/events",
+            "pdf_url": (
+                f"/api/certificates/{self.certificate_id}/pdf" if self.status == "done" else None
+            )
+        }
+
+
+class CertificateJobQueue:
+    """
+    In-process certificate render queue served by a fixed set of workers.
+    
+    At most `workers` jobs render at once (through pdf_render_pool) and at
+    most `queue_size` wait. Jobs are deduplicated by certificate ID: while a
+    job for a certificate is queued, rendering or done, submitting it again
+    returns that job. Finished jobs are forgotten after `retention_seconds`;
+    their PDFs stay in the certificate registry.
+    """
+    
+    # Seconds between sweeps of finished jobs
+    PRUNE_INTERVAL_SECONDS = 60
+    
+    def __init__(self, workers: int, queue_size: int, retention_seconds: int):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, CertificateJob] = {}
+        self.rejected = 0
+        self.mean_seconds = 0.1
+        self._by_certificate: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_prune = time.monotonic()
+    
+    def start(self) -> None:
+        """Start the workers on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+    
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished jobs are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    def submit(self, pdf_data: dict) -> Tuple[CertificateJob, bool]:
+        """
+        Queue a render, or return the live job for the same certificate.
+        
+        Returns:
+            The job, and whether it was newly created
+        """
+        self._prune()
+        existing = self.jobs.get(self._by_certificate.get(pdf_data["certificate_id"], ""))
+        if existing is not None and existing.status != "failed":
+            return existing, False
+        
+        if self._queue is None or self._queue.full():
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Certificate job queue is full, please retry",
+                headers={"Retry-After": str(retry_after_seconds(
+                    self.depth, self.workers, self.mean_seconds
+                ))}
+            )
+        
+        job = CertificateJob(pdf_data["certificate_id"], pdf_data)
+        self.jobs[job.job_id] = job
+        self._by_certificate[job.certificate_id] = job.job_id
+        self._queue.put_nowait(job)
+        return job, True
+    
+    def get(self, job_id: str) -> Optional[CertificateJob]:
+        """Look up a job by ID."""
+        return self.jobs.get(job_id)
+    
+    async def _work(self) -> None:
+        """Render queued jobs one at a time, storing each PDF in the registry."""
+        while True:
+            job = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                job.update("rendering")
+                # Job workers are a fixed number, so they skip the pool's capacity check
+                pdf_bytes = await pdf_render_pool.render(job.pdf_data, bounded=False)
+                if await run_in_threadpool(_keep_certificate_pdf, job.pdf_data, pdf_bytes):
+                    job.update("done")
+                else:
+                    # pdf_url would serve another document, or nothing
+                    job.update("failed", "Certificate data does not match the registered result")
+            except HTTPException as e:
+                job.update("failed", str(e.detail))
+            except Exception as e:
+                job.update("failed", str(e))
+            finally:
+                elapsed = time.perf_counter() - started
+                self.mean_seconds += AdmissionGate.SMOOTHING * (elapsed - self.mean_seconds)
+                self._queue.task_done()
+    
+    def _prune(self) -> None:
+        """Forget finished jobs past their retention, at most once per interval."""
+        now = time.monotonic()
+        if now - self._last_prune < self.PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = now
+        
+        cutoff = time.time() - self.retention_seconds
+        for job in [j for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job.job_id]
+            if self._by_certificate.get(job.certificate_id) == job.job_id:
+                del self._by_certificate[job.certificate_id]
+
+
+certificate_jobs = CertificateJobQueue(
+    CERT_JOB_WORKERS, CERT_JOB_QUEUE_SIZE, CERT_JOB_RETENTION_SECONDS
+)
+
+
+@app.on_event("startup")
+async def start_certificate_jobs():
+    """Start certificate job workers."""
+    certificate_jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_certificate_jobs():
+    """Stop certificate job workers."""
+    await certificate_jobs.stop()
+
+# ============================================================================
+# RESPONSE FORMATS
+# ============================================================================
+
+# Result fields that repeat the request back; dropped by format=compact
+ECHOED_INPUT_FIELDS = frozenset({
+    "applicant", "validity_days",
+    "gross_monthly_income", "dsr_ratio", "monthly_obligations", "principal_amount",
+    "annual_interest_rate", "interest_rate_percent", "term_years",
+    "stress_rate_bps", "stress_rate_percent"
+})
+
+# Also left out of compact results unless named in `fields`
+COMPACT_OMITTED_FIELDS = ECHOED_INPUT_FIELDS | {"verification_token"}
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+ResponseFormat = Literal["full", "compact"]
+
+
+def shape_result(result: dict, fields: Optional[str], response_format: ResponseFormat) -> dict:
+    """
+    Trim a calculation result for the client.
+    
+    Args:
+        result: Full calculation result (left unmodified; it may be cached)
+        fields: Comma-separated fields to keep, dotted for nested ones
+            (e.g. "certificate_id,stress_test.stress_max_loan")
+        response_format: "compact" drops *_formatted strings, echoed inputs
+            and the verification token, except top-level fields named in
+            `fields`
+    
+    Returns:
+        The shaped result
+    """
+    paths = [f.strip() for f in fields.split(",") if f.strip()] if fields else []
+    if response_format == "compact":
+        result = _compact(result, keep=frozenset(paths))
+    if paths:
+        result = _select_fields(result, paths)
+    return result
+
+
+def _compact(result: dict, keep: FrozenSet[str] = frozenset()) -> dict:
+    """Copy of a result without display strings, echoed inputs or the token, bar `keep`."""
+    return {
+        key: _compact(value) if isinstance(value, dict) else value
+        for key, value in result.items()
+        if key in keep or not (key.endswith("_formatted") or key in COMPACT_OMITTED_FIELDS)
+    }
+
+
+def _select_fields(result: dict, paths: List[str]) -> dict:
+    """Copy of a result with only the given (dotted) fields; unknown ones are ignored."""
+    nested: Dict[str, List[str]] = {}
+    for path in paths:
+        head, _, rest = path.partition(".")
+        nested.setdefault(head, []).append(rest)
+    
+    selected = {}
+    for key, rests in nested.items():
+        if key not in result:
+            continue
+        value = result[key]
+        # A bare name anywhere in the list keeps the whole value
+        if all(rests) and isinstance(value, dict):
+            value = _select_fields(value, rests)
+        selected[key] = value
+    return selected
+
+
+def encode_response(http_request: Request, content: Any) -> Response:
+    """
+    Serialize a response as MessagePack or JSON, following the Accept header.
+    
+    MessagePack is used when the client accepts it and msgpack is installed.
+    JSON is encoded with orjson when installed, else with compact json.
+    """
+    headers = {"Vary": "Accept"}
+    accept = http_request.headers.get("accept", "")
+    
+    if msgpack is not None and any(media in accept for media in MSGPACK_MEDIA_TYPES):
+        return Response(
+            msgpack.packb(content, default=_plain_scalar),
+            media_type="application/msgpack",
+            headers=headers
+        )
+    
+    if orjson is not None:
+        body = orjson.dumps(content, default=_plain_scalar)
+    else:
+        body = json.dumps(content, default=_plain_scalar, separators=(",", ":")).encode()
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _plain_scalar(value: Any) -> Any:
+    """Convert NumPy scalars for encoders that only know Python types."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+# ============================================================================
+# API ENDPOINTS
+# ============================================================================
+
+@app.get("/api/health", tags=["Health"])
+async def health_check():
+    """Check API health status."""
+    return {
+        "status": "healthy",
+        "service": "Pre-Qualification App API",
+        "version": "1.0.0"
+    }
+
+
+@app.get("/api/admission", tags=["Health"])
+async def admission_stats():
+    """Report admission gate limits, queue depth and rejection counts for capacity planning."""
+    return {
+        "classes": {name: gate.stats() for name, gate in admission_gates.items()},
+        "pdf_render_pool": {
+            "workers": pdf_render_pool.workers,
+            "capacity": pdf_render_pool.capacity,
+            "pending": pdf_render_pool.pending,
+            "rejected": pdf_render_pool.rejected
+        },
+        "certificate_jobs": {
+            "workers": certificate_jobs.workers,
+            "queue_size": certificate_jobs.queue_size,
+            "queued": certificate_jobs.depth,
+            "rejected": certificate_jobs.rejected
+        }
+    }
+
+
+@app.get("/api/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Expose request counters, in-flight gauges and stage latency histograms for Prometheus."""
+    return PlainTextResponse(render_metrics(MetricsMiddleware.in_flight), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/api/calculate", tags=["Calculations"])
+async def calculate(
+    request: CalculationRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    fields: Optional[str] = None,
+    response_format: ResponseFormat = Query("full", alias="format"),
+    sensitivity: bool = False
+):
+    """
+    Calculate pre-qualification based on input parameters.
+    
+    Supports two calculation types:
+    - AFFORDABILITY: Calculate maximum loan from income
+    - PAYMENT: Calculate monthly payment from loan amount
+    
+    Both include optional stress testing. Send `Accept: application/msgpack`
+    for MessagePack, and `fields=` / `format=compact` for smaller payloads.
+    `sensitivity=true` adds closed-form first derivatives of the headline
+    amount under a "sensitivity" key.
+    """
+    try:
+        result = _base_result(request)
+        
+        # Reuse results for inputs seen recently
+        cache_key = _calculation_cache_key(request)
+        calculated = calculation_cache.get(cache_key)
+        
+        if calculated is None:
+            # Process based on calculation type
+            with STAGE_LATENCY.time("calculation"):
+                if request.calculation_type == "AFFORDABILITY":
+                    calculated = _process_affordability(request)
+                else:
+                    calculated = _process_payment(request)
+            calculation_cache.put(cache_key, calculated)
+        
+        result.update(calculated)
+        result["verification_token"] = sign_certificate(result)
+        
+        # Index for lookup by certificate ID once the response is sent
+        background_tasks.add_task(certificate_registry.put_results, [result])
+        
+        if sensitivity:
+            result = {**result, "sensitivity": sensitivity_blocks([request])[0]}
+        
+        return encode_response(http_request, shape_result(result, fields, response_format))
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _base_result(request: CalculationRequest) -> dict:
+    """Build the identity fields shared by every calculation result."""
+    # Generate unique certificate ID
+    cert_id = str(uuid.uuid4())[:8].upper()
+    issue_date = datetime.now()
+    expiry_date = issue_date + timedelta(days=request.validity_days)
+    
+    return {
+        "certificate_id": cert_id,
+        "calculation_type": request.calculation_type,
+        "applicant": request.applicant.model_dump(),
+        "currency": request.currency,
+        "issue_date": issue_date.strftime("%Y-%m-%d"),
+        "expiry_date": expiry_date.strftime("%Y-%m-%d"),
+        "validity_days": request.validity_days
+    }
+
+
+def _process_affordability(request: CalculationRequest) -> dict:
+    """Process affordability calculation."""
+    if not request.affordability_input:
+        raise HTTPException(status_code=400, detail="Affordability input required")
+    
+    inp = request.affordability_input
+    
+    # Calculate affordable monthly payment
+    affordable_payment = (
+        inp.gross_monthly_income * inp.dsr_ratio
+    ) - inp.monthly_obligations
+    
+    # Validate positive affordability
+    if affordable_payment <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Monthly obligations exceed affordable debt service"
+        )
+    
+    # Calculate maximum loan
+    max_loan = calculate_max_loan(
+        affordable_payment,
+        inp.annual_interest_rate,
+        inp.term_years
+    )
+    
+    return _affordability_result(inp, affordable_payment, max_loan, request.currency)
+
+
+def _affordability_result(
+    inp: AffordabilityInput,
+    affordable_payment: float,
+    max_loan: float,
+    currency: str,
+    stress_max_loan: Optional[float] = None
+) -> dict:
+    """Assemble affordability result fields from computed amounts."""
+    result = {
+        "gross_monthly_income": inp.gross_monthly_income,
+        "dsr_ratio": inp.dsr_ratio,
+        "monthly_obligations": inp.monthly_obligations,
+        "affordable_payment": round(affordable_payment, 2),
+        "affordable_payment_formatted": format_currency(affordable_payment, currency),
+        "max_loan_amount": max_loan,
+        "max_loan_formatted": format_currency(max_loan, currency),
+        "annual_interest_rate": inp.annual_interest_rate,
+        "interest_rate_percent": round(inp.annual_interest_rate * 100, 2),
+        "term_years": inp.term_years,
+        "monthly_payment": round(affordable_payment, 2)
+    }
+    
+    # Add stress test if applicable
+    if inp.stress_rate_bps:
+        result["stress_test"] = _calculate_affordability_stress_test(
+            inp, affordable_payment, max_loan, currency, stress_max_loan
+        )
+    
+    return result
+
+
+def _calculate_affordability_stress_test(
+    inp: AffordabilityInput,
+    affordable_payment: float,
+    base_max_loan: float,
+    currency: str,
+    stress_max_loan: Optional[float] = None
+) -> dict:
+    """Calculate stress test for affordability."""
+    stress_rate = inp.annual_interest_rate + (inp.stress_rate_bps / 10000)
+    if stress_max_loan is None:
+        stress_max_loan = calculate_max_loan(
+            affordable_payment,
+            stress_rate,
+            inp.term_years
+        )
+    
+    return {
+        "stress_rate_bps": inp.stress_rate_bps,
+        "stress_annual_rate": stress_rate,
+        "stress_rate_percent": round(stress_rate * 100, 2),
+        "stress_max_loan": stress_max_loan,
+        "stress_max_loan_formatted": format_currency(stress_max_loan, currency),
+        "reduction_amount": round(base_max_loan - stress_max_loan, 2),
+        "reduction_percent": round(
+            ((base_max_loan - stress_max_loan) / base_max_loan) * 100, 2
+        )
+    }
+
+
+def _process_payment(request: CalculationRequest) -> dict:
+    """Process payment calculation."""
+    if not request.payment_input:
+        raise HTTPException(status_code=400, detail="Payment input required")
+    
+    inp = request.payment_input
+    
+    # Calculate monthly payment
+    monthly_payment = calculate_monthly_payment(
+        inp.principal_amount,
+        inp.annual_interest_rate,
+        inp.term_years
+    )
+    
+    return _payment_result(inp, monthly_payment, request.currency)
+
+
+def _payment_result(
+    inp: PaymentInput,
+    monthly_payment: float,
+    currency: str,
+    stress_payment: Optional[float] = None
+) -> dict:
+    """Assemble payment result fields from computed amounts."""
+    # Calculate totals
+    total_payments = monthly_payment * inp.term_years * 12
+    total_interest = total_payments - inp.principal_amount
+    
+    result = {
+        "principal_amount": inp.principal_amount,
+        "principal_formatted": format_currency(inp.principal_amount, currency),
+        "monthly_payment": monthly_payment,
+        "monthly_payment_formatted": format_currency(monthly_payment, currency),
+        "annual_interest_rate": inp.annual_interest_rate,
+        "interest_rate_percent": round(inp.annual_interest_rate * 100, 2),
+        "term_years": inp.term_years,
+        "total_payments": round(total_payments, 2),
+        "total_payments_formatted": format_currency(total_payments, currency),
+        "total_interest": round(total_interest, 2),
+        "total_interest_formatted": format_currency(total_interest, currency)
+    }
+    
+    # Add stress test if applicable
+    if inp.stress_rate_bps:
+        result["stress_test"] = _calculate_payment_stress_test(
+            inp, monthly_payment, currency, stress_payment
+        )
+    
+    return result
+
+
+def _calculate_payment_stress_test(
+    inp: PaymentInput,
+    base_payment: float,
+    currency: str,
+    stress_payment: Optional[float] = None
+) -> dict:
+    """Calculate stress test for payment."""
+    stress_rate = inp.annual_interest_rate + (inp.stress_rate_bps / 10000)
+    if stress_payment is None:
+        stress_payment = calculate_monthly_payment(
+            inp.principal_amount,
+            stress_rate,
+            inp.term_years
+        )
+    
+    return {
+        "stress_rate_bps": inp.stress_rate_bps,
+        "stress_annual_rate": stress_rate,
+        "stress_rate_percent": round(stress_rate * 100, 2),
+        "stress_monthly_payment": stress_payment,
+        "stress_payment_formatted": format_currency(stress_payment, currency),
+        "increase_amount": round(stress_payment - base_payment, 2),
+        "increase_percent": round(
+            ((stress_payment - base_payment) / base_payment) * 100, 2
+        )
+    }
+
+
+@app.get("/api/calculate/cache", tags=["Calculations"])
+async def calculation_cache_stats():
+    """Report calculation cache size and hit/miss counters."""
+    return calculation_cache.stats()
+
+
+# Seconds the live channel waits for further input before computing a burst
+LIVE_COALESCE_SECONDS = float(os.environ.get("LIVE_COALESCE_SECONDS", 0.02))
+
+# Request fields a live session may change
+LIVE_FIELDS = ("calculation_type", "currency", "affordability_input", "payment_input")
+
+# Live fields holding input sections, merged field by field
+LIVE_SECTIONS = ("affordability_input", "payment_input")
+
+
+class LiveCalculationSession:
+    """
+    Input state and last pushed result of one live recalculation socket.
+    
+    Deltas are merged into the state as they arrive; compute() evaluates
+    whatever the state is at that moment, so a burst of deltas costs one
+    calculation. Results are diffed against the last one pushed.
+    """
+    
+    def __init__(self):
+        self.state: Dict[str, Any] = {"calculation_type": "AFFORDABILITY", "currency": "TTD"}
+        self.seq: Any = None
+        self.sent: dict = {}
+        self.errors: List[dict] = []
+        self.dirty = False
+        self.changed = asyncio.Event()
+        self.closed = False
+    
+    def apply(self, text: Optional[str]) -> None:
+        """
+        Merge one `{"seq": ..., "changes": {...}}` message into the state.
+        
+        A binary frame (text None) is answered with an error and ignored.
+        """
+        if text is None:
+            self.errors.append(self._error(None, 400, "Expected a text frame"))
+            self.changed.set()
+            return
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict) or not isinstance(message.get("changes"), dict):
+            seq = message.get("seq") if isinstance(message, dict) else None
+            self.errors.append(self._error(seq, 400, 'Expected {"seq": ..., "changes": {...}}'))
+            self.changed.set()
+            return
+        
+        changes = message["changes"]
+        unknown = sorted(set(changes) - set(LIVE_FIELDS))
+        if unknown:
+            self.errors.append(self._error(message.get("seq"), 400, f"Unknown fields: {', '.join(unknown)}"))
+        
+        # Sections must stay objects so later deltas can merge into them
+        malformed = sorted(
+            key for key in LIVE_SECTIONS
+            if changes.get(key) is not None and not isinstance(changes[key], dict)
+        )
+        if malformed:
+            self.errors.append(self._error(
+                message.get("seq"), 400, f"Expected an object for: {', '.join(malformed)}"
+            ))
+        
+        for key in LIVE_FIELDS:
+            if key not in changes or key in malformed:
+                continue
+            value = changes[key]
+            if value is None:
+                self.state.pop(key, None)
+            elif key in LIVE_SECTIONS:
+                # Inputs merge field by field; null drops a field
+                section = self.state.setdefault(key, {})
+                for field, field_value in value.items():
+                    if field_value is None:
+                        section.pop(field, None)
+                    else:
+                        section[field] = field_value
+            else:
+                self.state[key] = value
+        
+        self.seq = message.get("seq")
+        self.dirty = True
+        self.changed.set()
+    
+    def compute(self) -> dict:
+        """Calculate the current state and return a result or error message."""
+        self.dirty = False
+        section = (
+            "affordability_input" if self.state.get("calculation_type") == "AFFORDABILITY"
+            else "payment_input"
+        )
+        
+        # Only the active input is validated; the other may be half filled in
+        try:
+            live = LiveCalculationState.model_validate({
+                key: self.state[key]
+                for key in ("calculation_type", "currency", section) if key in self.state
+            })
+        except ValidationError as e:
+            return self._error(self.seq, 422, _validation_messages(e))
+        
+        request = CalculationRequest.model_construct(**dict(live))
+        cache_key = _calculation_cache_key(request)
+        calculated = calculation_cache.get(cache_key)
+        if calculated is None:
+            try:
+                with STAGE_LATENCY.time("calculation"):
+                    if request.calculation_type == "AFFORDABILITY":
+                        calculated = _process_affordability(request)
+                    else:
+                        calculated = _process_payment(request)
+            except HTTPException as e:
+                return self._error(self.seq, e.status_code, e.detail)
+            calculation_cache.put(cache_key, calculated)
+        
+        result = {"calculation_type": request.calculation_type, "currency": request.currency, **calculated}
+        changed, removed = _diff_result(self.sent, result)
+        self.sent = result
+        return {"type": "result", "seq": self.seq, "changed": changed, "removed": removed}
+    
+    @staticmethod
+    def _error(seq: Any, status_code: int, detail: Any) -> dict:
+        return {"type": "error", "seq": seq, "status_code": status_code, "detail": detail}
+
+
+def _diff_result(previous: dict, current: dict) -> Tuple[dict, List[str]]:
+    """
+    Fields of `current` that differ from `previous`, recursing into dicts.
+    
+    Returns:
+        Changed values (nested dicts hold only their changed keys) and the
+        dotted paths of keys that disappeared
+    """
+    changed = {}
+    removed = []
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested_changed, nested_removed = _diff_result(old, value)
+            if nested_changed:
+                changed[key] = nested_changed
+            removed.extend(f"{key}.{path}" for path in nested_removed)
+        elif key not in previous or old != value:
+            changed[key] = value
+    removed.extend(key for key in previous if key not in current)
+    return changed, removed
+
+
+@app.websocket("/api/calculate/live")
+async def calculate_live(websocket: WebSocket):
+    """
+    Live recalculation over one long-lived WebSocket.
+    
+    The client sends `{"seq": n, "changes": {...}}` deltas of the
+    calculation_type, currency and input fields (inputs merge field by
+    field; null removes a field). Bursts are coalesced so only the latest
+    state is computed, and each reply carries only the result fields that
+    changed, tagged with the seq of the last delta it includes. No
+    certificate ID is issued; submit to /api/calculate for that.
+    """
+    await websocket.accept()
+    session = LiveCalculationSession()
+    
+    async def read_deltas() -> None:
+        try:
+            while True:
+                # receive_text() would fail on a binary frame, so read raw messages
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                session.apply(message.get("text"))
+        finally:
+            session.closed = True
+            session.changed.set()
+    
+    reader = asyncio.create_task(read_deltas())
+    try:
+        while True:
+            await session.changed.wait()
+            # Let the rest of a burst arrive before computing
+            await asyncio.sleep(LIVE_COALESCE_SECONDS)
+            session.changed.clear()
+            if session.closed:
+                break
+            
+            errors, session.errors = session.errors, []
+            for error in errors:
+                await websocket.send_json(error)
+            if session.dirty:
+                await websocket.send_json(session.compute())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+
+@app.post("/api/calculate/batch", tags=["Calculations"])
+async def calculate_batch(
+    batch: BatchCalculationRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    fields: Optional[str] = None,
+    response_format: ResponseFormat = Query("full", alias="format"),
+    sensitivity: bool = False
+):
     """
-    Generate PDF certificate with pre-qualification results.
+    Run many pre-qualification calculations in one request.
     
-    Args:
-        cert_data: Dictionary containing certificate information
+    Each item is validated on its own and the annuity math for all valid
+    items runs as array operations. Failed items are reported in place
+    without failing the rest of the batch. Accepts the same `fields=`,
+    `format=`, `sensitivity=` and Accept negotiation as /api/calculate,
+    applied per result.
     
     Returns:
-        File path to generated PDF
+        Per-item results in input order, plus success/failure counts
     """
-    cert_id = cert_data['certificate_id']
-    filepath = PDF_DIR / f"{cert_id}.pdf"
+    results: List[Optional[dict]] = [None] * len(batch.requests)
+    affordability_items: List[Tuple[int, CalculationRequest]] = []
+    payment_items: List[Tuple[int, CalculationRequest]] = []
     
-    # Create PDF canvas
-    c = canvas.Canvas(str(filepath), pagesize=letter)
-    width, height = letter
+    for index, payload in enumerate(batch.requests):
+        try:
+            request = CalculationRequest.model_validate(payload)
+        except ValidationError as e:
+            results[index] = _batch_error(index, 422, _validation_messages(e))
+            continue
+        
+        if request.calculation_type == "AFFORDABILITY":
+            if not request.affordability_input:
+                results[index] = _batch_error(index, 400, "Affordability input required")
+            else:
+                affordability_items.append((index, request))
+        else:
+            if not request.payment_input:
+                results[index] = _batch_error(index, 400, "Payment input required")
+            else:
+                payment_items.append((index, request))
     
-    # Draw header
-    _draw_header(c, width, height)
+    _run_affordability_batch(affordability_items, results)
+    _run_payment_batch(payment_items, results)
     
-    # Draw certificate details
-    y_pos = height - 150
-    y_pos = _draw_certificate_info(c, cert_data, y_pos, width)
-    y_pos = _draw_applicant_info(c, cert_data, y_pos)
-    y_pos = _draw_results_section(c, cert_data, y_pos, width)
-    y_pos = _draw_stress_test(c, cert_data, y_pos)
-    y_pos = _draw_disclaimer(c, cert_data, y_pos)
+    indexed = [item["result"] for item in results if item["success"]]
+    if indexed:
+        background_tasks.add_task(certificate_registry.put_results, indexed)
     
-    # Draw footer
-    _draw_footer(c, width)
+    if sensitivity:
+        requests = {index: request for index, request in affordability_items + payment_items}
+        succeeded_items = [item for item in results if item["success"]]
+        blocks = sensitivity_blocks([requests[item["index"]] for item in succeeded_items])
+        block_by_index = {item["index"]: block for item, block in zip(succeeded_items, blocks)}
+        results = [
+            {**item, "result": {**item["result"], "sensitivity": block_by_index[item["index"]]}}
+            if item["success"] else item
+            for item in results
+        ]
     
-    c.save()
-    return str(filepath)
+    if fields or response_format != "full":
+        results = [
+            {**item, "result": shape_result(item["result"], fields, response_format)}
+            if item["success"] else item
+            for item in results
+        ]
+    
+    succeeded = len(indexed)
+    return encode_response(http_request, {
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
+    })
 
 
-def _draw_header(c: canvas.Canvas, width: float, height: float) -> None:
-    """Draw certificate header with lime green background."""
-    c.setFillColor(COLORS["lime_green"])
-    c.rect(0, height - 120, width, 120, fill=1, stroke=0)
+def _batch_error(index: int, status_code: int, detail: Any) -> dict:
+    """Build a per-item error entry for a batch response."""
+    return {
+        "index": index,
+        "success": False,
+        "status_code": status_code,
+        "detail": detail
+    }
+
+
+def _validation_messages(error: ValidationError) -> List[dict]:
+    """Reduce pydantic errors to JSON-safe location/message pairs."""
+    return [
+        {"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]}
+        for err in error.errors()
+    ]
+
+
+def _run_affordability_batch(
+    items: List[Tuple[int, CalculationRequest]],
+    results: List[Optional[dict]]
+) -> None:
+    """Compute affordability results for validated batch items in place."""
+    if not items:
+        return
     
-    c.setFillColor(COLORS["white"])
-    c.setFont("Helvetica-Bold", 32)
-    c.drawCentredString(width / 2, height - 60, "Pre-Qualification App")
+    inputs = [request.affordability_input for _, request in items]
+    income = np.array([inp.gross_monthly_income for inp in inputs])
+    dsr = np.array([inp.dsr_ratio for inp in inputs])
+    obligations = np.array([inp.monthly_obligations for inp in inputs])
+    rates = np.array([inp.annual_interest_rate for inp in inputs])
+    terms = np.array([inp.term_years for inp in inputs], dtype=np.float64)
+    bps = np.array([inp.stress_rate_bps or 0 for inp in inputs], dtype=np.float64)
     
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(width / 2, height - 90, "Pre-Qualification Certificate")
+    affordable = (income * dsr) - obligations
+    stress_rates = rates + (bps / 10000)
+    
+    # Base and stressed scenarios share one array pass
+    payments = np.concatenate([affordable, affordable])
+    all_rates = np.concatenate([rates, stress_rates])
+    all_terms = np.concatenate([terms, terms])
+    max_loans = round_cents(
+        calculate_max_loans(payments, all_rates, all_terms),
+        lambda i: calculate_max_loan(
+            float(payments[i]), float(all_rates[i]), int(all_terms[i])
+        )
+    )
+    
+    count = len(items)
+    for position, (index, request) in enumerate(items):
+        affordable_payment = float(affordable[position])
+        if affordable_payment <= 0:
+            results[index] = _batch_error(
+                index, 400, "Monthly obligations exceed affordable debt service"
+            )
+            continue
+        
+        result = _base_result(request)
+        result.update(_affordability_result(
+            inputs[position],
+            affordable_payment,
+            max_loans[position],
+            request.currency,
+            stress_max_loan=max_loans[count + position]
+        ))
+        result["verification_token"] = sign_certificate(result)
+        results[index] = {"index": index, "success": True, "result": result}
 
 
-def _draw_certificate_info(
-    c: canvas.Canvas,
-    cert_data: dict,
-    y_pos: float,
-    width: float
-) -> float:
-    """Draw certificate ID and date information."""
-    c.setFillColor(COLORS["dark_green"])
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y_pos, f"Certificate ID: {cert_data['certificate_id']}")
-    c.drawRightString(width - 50, y_pos, f"Issue Date: {cert_data['issue_date']}")
-    c.drawRightString(width - 50, y_pos - 15, f"Expiry Date: {cert_data['expiry_date']}")
+def _run_payment_batch(
+    items: List[Tuple[int, CalculationRequest]],
+    results: List[Optional[dict]]
+) -> None:
+    """Compute payment results for validated batch items in place."""
+    if not items:
+        return
     
-    return y_pos - 50
+    inputs = [request.payment_input for _, request in items]
+    principal = np.array([inp.principal_amount for inp in inputs])
+    rates = np.array([inp.annual_interest_rate for inp in inputs])
+    terms = np.array([inp.term_years for inp in inputs], dtype=np.float64)
+    bps = np.array([inp.stress_rate_bps or 0 for inp in inputs], dtype=np.float64)
+    
+    stress_rates = rates + (bps / 10000)
+    
+    # Base and stressed scenarios share one array pass
+    principals = np.concatenate([principal, principal])
+    all_rates = np.concatenate([rates, stress_rates])
+    all_terms = np.concatenate([terms, terms])
+    payments = round_cents(
+        calculate_monthly_payments(principals, all_rates, all_terms),
+        lambda i: calculate_monthly_payment(
+            float(principals[i]), float(all_rates[i]), int(all_terms[i])
+        )
+    )
+    
+    count = len(items)
+    for position, (index, request) in enumerate(items):
+        result = _base_result(request)
+        result.update(_payment_result(
+            inputs[position],
+            payments[position],
+            request.currency,
+            stress_payment=payments[count + position]
+        ))
+        result["verification_token"] = sign_certificate(result)
+        results[index] = {"index": index, "success": True, "result": result}
 
 
-def _draw_applicant_info(c: canvas.Canvas, cert_data: dict, y_pos: float) -> float:
-    """Draw applicant information section."""
-    c.setFont("Helvetica-Bold", 14)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawString(50, y_pos, "Applicant Information")
+def sensitivity_blocks(requests: List[CalculationRequest]) -> List[dict]:
+    """
+    Build sensitivity blocks for validated calculation requests.
     
-    c.setFillColor(COLORS["dark_green"])
-    c.setFont("Helvetica", 11)
-    y_pos -= 25
-    c.drawString(70, y_pos, f"Name: {cert_data['applicant_name']}")
+    Affordability requests get derivatives of the maximum loan, payment
+    requests derivatives of the monthly payment. Each calculation type is
+    evaluated in one array pass, so batches cost about the same as one item.
     
-    if cert_data.get('applicant_email'):
-        y_pos -= 20
-        c.drawString(70, y_pos, f"Email: {cert_data['applicant_email']}")
+    Args:
+        requests: Requests whose input for their calculation type is present
     
-    return y_pos - 40
+    Returns:
+        One sensitivity dict per request, in input order
+    """
+    blocks: List[Optional[dict]] = [None] * len(requests)
+    affordability = [(i, r.affordability_input) for i, r in enumerate(requests) if r.calculation_type == "AFFORDABILITY"]
+    payment = [(i, r.payment_input) for i, r in enumerate(requests) if r.calculation_type != "AFFORDABILITY"]
+    
+    if affordability:
+        income = np.array([inp.gross_monthly_income for _, inp in affordability])
+        dsr = np.array([inp.dsr_ratio for _, inp in affordability])
+        obligations = np.array([inp.monthly_obligations for _, inp in affordability])
+        rates = np.array([inp.annual_interest_rate for _, inp in affordability])
+        terms = np.array([inp.term_years for _, inp in affordability], dtype=np.float64)
+        
+        derivatives = max_loan_sensitivities(income * dsr - obligations, rates, terms)
+        factor = derivatives["per_payment_unit"]
+        
+        for position, (index, _) in enumerate(affordability):
+            blocks[index] = {
+                "max_loan_per_bp": round(float(derivatives["per_bp"][position]), 2),
+                "max_loan_per_term_year": round(float(derivatives["per_term_year"][position]), 2),
+                "max_loan_per_income_unit": round(float(dsr[position] * factor[position]), 4),
+                "max_loan_per_obligation_unit": round(float(-factor[position]), 4),
+                "max_loan_per_dsr_point": round(float(income[position] * factor[position] / 100), 2)
+            }
+    
+    if payment:
+        principal = np.array([inp.principal_amount for _, inp in payment])
+        rates = np.array([inp.annual_interest_rate for _, inp in payment])
+        terms = np.array([inp.term_years for _, inp in payment], dtype=np.float64)
+        
+        derivatives = monthly_payment_sensitivities(principal, rates, terms)
+        
+        for position, (index, _) in enumerate(payment):
+            blocks[index] = {
+                "payment_per_bp": round(float(derivatives["per_bp"][position]), 4),
+                "payment_per_term_year": round(float(derivatives["per_term_year"][position]), 2),
+                "payment_per_1000_principal": round(float(derivatives["per_principal_unit"][position] * 1000), 4)
+            }
+    
+    return blocks
 
 
-def _draw_results_section(
-    c: canvas.Canvas,
-    cert_data: dict,
-    y_pos: float,
-    width: float
-) -> float:
-    """Draw results box with calculation outcomes."""
-    c.setFont("Helvetica-Bold", 14)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawString(50, y_pos, "Assessment Results")
+# Periods serialized per streamed chunk
+SCHEDULE_CHUNK_PERIODS = 120
+
+
+@app.post("/api/schedule", tags=["Calculations"])
+async def amortization_schedule(request: ScheduleRequest):
+    """
+    Stream the month-by-month amortization schedule for a loan.
     
-    # Draw results box
-    y_pos -= 30
-    c.setFillColor(COLORS["light_bg"])
-    c.rect(50, y_pos - 150, width - 100, 150, fill=1, stroke=1)
-    c.setStrokeColor(COLORS["lime_green"])
-    c.setLineWidth(2)
-    c.rect(50, y_pos - 150, width - 100, 150, fill=0, stroke=1)
+    Rows carry payment, interest, principal and balance. When
+    stress_rate_bps is set, matching stress_* columns are added for the
+    same loan at the stressed rate. Output is NDJSON or CSV.
+    """
+    inp = request.payment_input
+    columns = calculate_amortization_schedule(
+        inp.principal_amount,
+        inp.annual_interest_rate,
+        inp.term_years
+    )
     
-    # Draw results text
-    c.setFillColor(COLORS["dark_green"])
-    c.setFont("Helvetica", 11)
-    y_pos -= 25
+    if inp.stress_rate_bps:
+        stress_rate = inp.annual_interest_rate + (inp.stress_rate_bps / 10000)
+        stress = calculate_amortization_schedule(
+            inp.principal_amount,
+            stress_rate,
+            inp.term_years
+        )
+        columns = _overlay_schedules(columns, stress)
     
-    calc_type = cert_data['calculation_type']
-    if calc_type == "AFFORDABILITY":
-        y_pos = _draw_affordability_results(c, cert_data, y_pos)
+    if request.format == "csv":
+        return StreamingResponse(
+            _stream_schedule(columns, "csv"),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=amortization_schedule.csv"}
+        )
+    
+    return StreamingResponse(
+        _stream_schedule(columns, "ndjson"),
+        media_type="application/x-ndjson"
+    )
+
+
+def _overlay_schedules(
+    base: Dict[str, np.ndarray],
+    stress: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """Merge a stressed schedule into the base one as stress_* columns."""
+    rows = max(len(base["period"]), len(stress["period"]))
+    
+    # A schedule that clears early pays nothing in the remaining periods
+    def pad(column: np.ndarray) -> np.ndarray:
+        return np.pad(column, (0, rows - len(column)))
+    
+    columns = {"period": np.arange(1, rows + 1, dtype=np.int64)}
+    for name in ("payment", "interest", "principal", "balance"):
+        columns[name] = pad(base[name])
+    for name in ("payment", "interest", "principal", "balance"):
+        columns[f"stress_{name}"] = pad(stress[name])
+    
+    return columns
+
+
+def _stream_schedule(columns: Dict[str, np.ndarray], fmt: str) -> Iterator[str]:
+    """Serialize schedule columns chunk by chunk as NDJSON or CSV lines."""
+    names = list(columns)
+    rows = len(columns["period"])
+    
+    if fmt == "csv":
+        yield ",".join(names) + "\n"
+    
+    for start in range(0, rows, SCHEDULE_CHUNK_PERIODS):
+        chunk = [columns[name][start:start + SCHEDULE_CHUNK_PERIODS].tolist() for name in names]
+        lines = []
+        
+        for values in zip(*chunk):
+            # Period is a count, everything else is cents
+            fields = [str(values[0])] + [f"{cents / 100:.2f}" for cents in values[1:]]
+            if fmt == "csv":
+                lines.append(",".join(fields) + "\n")
+            else:
+                pairs = ",".join(f'"{name}":{field}' for name, field in zip(names, fields))
+                lines.append("{" + pairs + "}\n")
+        
+        yield "".join(lines)
+
+
+@app.post("/api/stress-surface", tags=["Calculations"])
+async def stress_surface(request: StressSurfaceRequest):
+    """
+    Build a rate x term x stress-bps sensitivity grid in one call.
+    
+    Every cell is the max loan (AFFORDABILITY) or monthly payment (PAYMENT)
+    at base rate + shock, matching what /api/calculate would return for
+    that point. Values are returned flat in row-major order over the axes.
+    """
+    if request.calculation_type == "AFFORDABILITY":
+        if not request.affordability_input:
+            raise HTTPException(status_code=400, detail="Affordability input required")
+        inp = request.affordability_input
+        amount = (inp.gross_monthly_income * inp.dsr_ratio) - inp.monthly_obligations
+        if amount <= 0:
+            raise HTTPException(
+                status_code=400,
+                detail="Monthly obligations exceed affordable debt service"
+            )
+        metric, scalar_fn, vector_fn = "max_loan_amount", calculate_max_loan, calculate_max_loans
     else:
-        y_pos = _draw_payment_results(c, cert_data, y_pos)
+        if not request.payment_input:
+            raise HTTPException(status_code=400, detail="Payment input required")
+        inp = request.payment_input
+        amount = inp.principal_amount
+        metric, scalar_fn, vector_fn = (
+            "monthly_payment", calculate_monthly_payment, calculate_monthly_payments
+        )
     
-    # Common details
-    c.setFont("Helvetica", 11)
-    c.setFillColor(COLORS["dark_green"])
-    y_pos -= 25
-    c.drawString(70, y_pos, f"Annual Interest Rate: {cert_data['interest_rate']}%")
-    y_pos -= 20
-    c.drawString(70, y_pos, f"Loan Term: {cert_data['term_years']} years")
+    rates = request.annual_interest_rates or [inp.annual_interest_rate]
+    terms = request.term_years or [inp.term_years]
+    shocks = request.stress_bps or [inp.stress_rate_bps or 0]
+    shape = (len(rates), len(terms), len(shocks))
     
-    return y_pos - 30
+    if math.prod(shape) > MAX_SURFACE_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Surface exceeds {MAX_SURFACE_CELLS} cells"
+        )
+    
+    # Broadcast rate x bps against term: (rates, 1, shocks) with (1, terms, 1)
+    effective_rates = (
+        np.array(rates)[:, None, None] + (np.array(shocks, dtype=np.float64) / 10000)[None, None, :]
+    )
+    term_grid = np.array(terms, dtype=np.float64)[None, :, None]
+    values = vector_fn(amount, effective_rates, term_grid)
+    
+    def exact(index: int) -> float:
+        i, j, k = np.unravel_index(index, shape)
+        return scalar_fn(amount, float(effective_rates[i, 0, k]), terms[j])
+    
+    return {
+        "calculation_type": request.calculation_type,
+        "metric": metric,
+        "currency": request.currency,
+        "input_amount": round(amount, 2),
+        "axes": ["annual_interest_rate", "term_years", "stress_bps"],
+        "annual_interest_rate": rates,
+        "term_years": terms,
+        "stress_bps": shocks,
+        "shape": list(shape),
+        "values": round_cents(values.ravel(), exact)
+    }
 
 
-def _draw_affordability_results(
-    c: canvas.Canvas,
+@app.post("/api/simulate/variable-rate", tags=["Calculations"])
+async def simulate_variable_rate(request: RateSimulationRequest):
+    """
+    Monte Carlo payment shock for adjustable-rate loans.
+    
+    Simulates `paths` seeded rate paths, re-amortizes the loan at every
+    reset and returns percentile bands per reset period of rate, monthly
+    payment and payment-to-income, plus the distribution of each path's
+    peak payment. Bands are listed by the payment number each period starts at.
+    """
+    if request.calculation_type == "AFFORDABILITY":
+        if not request.affordability_input:
+            raise HTTPException(status_code=400, detail="Affordability input required")
+        inp = request.affordability_input
+        affordable_payment = (inp.gross_monthly_income * inp.dsr_ratio) - inp.monthly_obligations
+        if affordable_payment <= 0:
+            raise HTTPException(
+                status_code=400,
+                detail="Monthly obligations exceed affordable debt service"
+            )
+        principal = calculate_max_loan(affordable_payment, inp.annual_interest_rate, inp.term_years)
+        income = inp.gross_monthly_income
+    else:
+        if not request.payment_input:
+            raise HTTPException(status_code=400, detail="Payment input required")
+        inp = request.payment_input
+        principal = inp.principal_amount
+        income = request.gross_monthly_income
+    
+    term_months = inp.term_years * 12
+    periods = -(-term_months // request.reset_months)
+    if periods * request.paths > MAX_SIMULATION_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Simulation exceeds {MAX_SIMULATION_CELLS} path-periods"
+        )
+    
+    seed = request.seed if request.seed is not None else random.getrandbits(63)
+    rates = simulate_rate_paths(
+        inp.annual_interest_rate,
+        request.paths,
+        periods,
+        request.reset_months / 12,
+        request.mean_reversion,
+        request.volatility,
+        request.long_run_rate or inp.annual_interest_rate,
+        request.rate_floor,
+        request.rate_cap,
+        np.random.default_rng(seed)
+    )
+    payments = simulate_payments(principal, term_months, request.reset_months, rates)
+    peak_payments = payments.max(axis=0)
+    
+    # Scaling by a fixed income commutes with percentiles, so ratios reuse these
+    payment_bands = simulation_percentiles(payments, request.percentiles)
+    peak_bands = simulation_percentiles(peak_payments, request.percentiles)
+    
+    result = {
+        "calculation_type": request.calculation_type,
+        "currency": request.currency,
+        "principal_amount": principal,
+        "principal_formatted": format_currency(principal, request.currency),
+        "initial_payment": round(float(payments[0, 0]), 2),
+        "gross_monthly_income": income,
+        "paths": request.paths,
+        "seed": seed,
+        "reset_months": request.reset_months,
+        "percentiles": request.percentiles,
+        "payment_numbers": list(range(1, term_months + 1, request.reset_months)),
+        "rate_bands": _percentile_bands(simulation_percentiles(rates, request.percentiles), request.percentiles, 6),
+        "payment_bands": _percentile_bands(payment_bands, request.percentiles, 2),
+        "peak_payment": _percentile_bands(peak_bands, request.percentiles, 2),
+        "payment_to_income_bands": None,
+        "peak_payment_to_income": None
+    }
+    
+    if income:
+        result["payment_to_income_bands"] = _percentile_bands(payment_bands / income, request.percentiles, 4)
+        result["peak_payment_to_income"] = _percentile_bands(peak_bands / income, request.percentiles, 4)
+    
+    if request.calculation_type == "AFFORDABILITY":
+        # Share of paths whose payment ever breaks the applicant's DSR limit
+        breached = (peak_payments + inp.monthly_obligations) > income * inp.dsr_ratio + 0.005
+        result["dsr_breach_probability"] = round(float(breached.mean()), 4)
+    
+    return result
+
+
+@app.post("/api/solve", tags=["Calculations"])
+async def solve(request: SolveRequest):
+    """
+    Solve for the income, obligations, rate or term that qualifies for a target loan.
+    
+    The answer honours dsr_ratio and still qualifies with stress_rate_bps
+    added to the rate. Returns 400 when no qualifying value exists.
+    """
+    result = _solve_results([request])[0]
+    if isinstance(result, str):
+        raise HTTPException(status_code=400, detail=result)
+    return result
+
+
+@app.post("/api/solve/batch", tags=["Calculations"])
+async def solve_batch(batch: BatchSolveRequest):
+    """
+    Run many solve requests in one call; the root-finding runs as array operations.
+    
+    Returns:
+        Per-item results in input order, plus success/failure counts
+    """
+    results: List[Optional[dict]] = [None] * len(batch.requests)
+    valid: List[Tuple[int, SolveRequest]] = []
+    
+    for index, payload in enumerate(batch.requests):
+        try:
+            valid.append((index, SolveRequest.model_validate(payload)))
+        except ValidationError as e:
+            results[index] = _batch_error(index, 422, _validation_messages(e))
+    
+    solved = _solve_results([request for _, request in valid])
+    for (index, _), result in zip(valid, solved):
+        if isinstance(result, str):
+            results[index] = _batch_error(index, 400, result)
+        else:
+            results[index] = {"index": index, "success": True, "result": result}
+    
+    succeeded = sum(1 for item in results if item["success"])
+    return {
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
+    }
+
+
+def _solve_results(requests: List[SolveRequest]) -> List[Any]:
+    """Solve requests grouped by solve_for; each entry is a result dict or an error message."""
+    results: List[Any] = [None] * len(requests)
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, request in enumerate(requests):
+        groups[request.solve_for].append(index)
+    
+    for indices in groups.values():
+        items = [requests[i] for i in indices]
+        scenario, reasons = solve_scenarios(items)
+        
+        for position, (index, request) in enumerate(zip(indices, items)):
+            if reasons[position]:
+                results[index] = reasons[position]
+            else:
+                values = {name: float(column[position]) for name, column in scenario.items()}
+                results[index] = _solve_result(request, values)
+    
+    return results
+
+
+def _solve_result(request: SolveRequest, values: Dict[str, float]) -> dict:
+    """Assemble a solve result, checking the answer forward as /api/calculate would."""
+    currency = request.currency
+    values["term_years"] = int(values["term_years"])
+    affordable_payment = (
+        values["gross_monthly_income"] * values["dsr_ratio"] - values["monthly_obligations"]
+    )
+    qualifying_rate = values["annual_interest_rate"] + (request.stress_rate_bps / 10000)
+    qualifying_max_loan = calculate_max_loan(
+        affordable_payment, qualifying_rate, values["term_years"]
+    )
+    
+    return {
+        "solve_for": request.solve_for,
+        "solved_value": values[request.solve_for],
+        "currency": currency,
+        "target_loan_amount": request.target_loan_amount,
+        "target_loan_formatted": format_currency(request.target_loan_amount, currency),
+        "scenario": {
+            "gross_monthly_income": values["gross_monthly_income"],
+            "dsr_ratio": values["dsr_ratio"],
+            "monthly_obligations": values["monthly_obligations"],
+            "annual_interest_rate": values["annual_interest_rate"],
+            "term_years": values["term_years"],
+            "stress_rate_bps": request.stress_rate_bps
+        },
+        "interest_rate_percent": round(values["annual_interest_rate"] * 100, 4),
+        "qualifying_rate": round(qualifying_rate, 6),
+        "affordable_payment": round(affordable_payment, 2),
+        "affordable_payment_formatted": format_currency(affordable_payment, currency),
+        "qualifying_max_loan": qualifying_max_loan,
+        "qualifying_max_loan_formatted": format_currency(qualifying_max_loan, currency)
+    }
+
+
+# Scenarios per portfolio stress run
+MAX_PORTFOLIO_SCENARIOS = 20
+
+
+@app.post("/api/portfolio/stress", tags=["Calculations"])
+async def portfolio_stress(
+    http_request: Request,
+    stress_bps: List[Annotated[int, Field(ge=0, le=1000)]] = Query([200]),
+    dsr_threshold: float = Query(0.4, gt=0, le=1),
+    summary_only: bool = False
+):
+    """
+    Stress a loan book uploaded as the CSV request body.
+    
+    Columns: principal, annual_interest_rate, remaining_term_months, and
+    optionally loan_id, gross_monthly_income and monthly_obligations. The
+    upload is spooled to a temporary file and the result is streamed back
+    as CSV: one row per loan, then a blank line and a per-scenario summary.
+    
+    Args:
+        stress_bps: Rate shocks to apply, repeat for several scenarios
+        dsr_threshold: DSR above which a loan counts as stretched
+        summary_only: Return only the summary, as JSON
+    """
+    scenarios = sorted(set(stress_bps))
+    if len(scenarios) > MAX_PORTFOLIO_SCENARIOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_PORTFOLIO_SCENARIOS} stress scenarios per run"
+        )
+    
+    upload = await _spool_portfolio_upload(http_request)
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    try:
+        columns = read_portfolio_header(reader)
+    except (ValueError, UnicodeDecodeError) as e:
+        text.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    totals = PortfolioTotals(scenarios, dsr_threshold)
+    
+    if summary_only:
+        try:
+            await run_in_threadpool(list, stress_portfolio(reader, columns, totals, emit_rows=False))
+        finally:
+            text.close()
+        return {"dsr_threshold": dsr_threshold, "scenarios": totals.summary()}
+    
+    return StreamingResponse(
+        _close_after(stress_portfolio(reader, columns, totals), text),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="portfolio_stress.csv"'}
+    )
+
+
+async def _spool_portfolio_upload(http_request: Request) -> tempfile.SpooledTemporaryFile:
+    """
+    Copy the request body into a spooled temporary file, rewound for reading.
+    
+    Writes go through the threadpool in PORTFOLIO_WRITE_BYTES batches, as
+    the spool spills to disk past PORTFOLIO_SPOOL_BYTES.
+    
+    Raises:
+        HTTPException: 413 if the body exceeds PORTFOLIO_MAX_UPLOAD_BYTES
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Portfolio upload exceeds {PORTFOLIO_MAX_UPLOAD_BYTES} bytes"
+    )
+    declared = http_request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > PORTFOLIO_MAX_UPLOAD_BYTES:
+        raise too_large
+    
+    upload = tempfile.SpooledTemporaryFile(max_size=PORTFOLIO_SPOOL_BYTES)
+    try:
+        received = 0
+        pending = bytearray()
+        async for chunk in http_request.stream():
+            received += len(chunk)
+            if received > PORTFOLIO_MAX_UPLOAD_BYTES:
+                raise too_large
+            pending += chunk
+            if len(pending) >= PORTFOLIO_WRITE_BYTES:
+                await run_in_threadpool(upload.write, bytes(pending))
+                pending.clear()
+        await run_in_threadpool(upload.write, bytes(pending))
+        upload.seek(0)
+    except BaseException:
+        upload.close()
+        raise
+    return upload
+
+
+def _close_after(blocks: Iterator[str], resource: io.IOBase) -> Iterator[str]:
+    """Yield from blocks, closing resource once they are exhausted or abandoned."""
+    try:
+        yield from blocks
+    finally:
+        resource.close()
+
+
+# ETags of rendered PDFs by render input; rendering is deterministic, so a
+# repeat request whose If-None-Match matches is answered without rendering
+PDF_ETAG_TTL_SECONDS = 86400
+pdf_etags = CalculationCache(CALC_CACHE_SIZE, PDF_ETAG_TTL_SECONDS)
+
+
+@app.post("/api/generate-certificate/{certificate_id}", tags=["Certificates"])
+async def generate_certificate(
+    certificate_id: str,
     cert_data: dict,
-    y_pos: float
-) -> float:
-    """Draw affordability calculation results."""
-    c.drawString(70, y_pos, f"Gross Monthly Income: {cert_data['gross_income']}")
-    y_pos -= 20
-    c.drawString(70, y_pos, f"DSR Ratio: {cert_data['dsr_ratio']}%")
-    y_pos -= 20
-    c.drawString(70, y_pos, f"Monthly Obligations: {cert_data['monthly_obligations']}")
-    y_pos -= 20
-    c.drawString(70, y_pos, f"Affordable Monthly Payment: {cert_data['affordable_payment']}")
-    y_pos -= 25
+    background_tasks: BackgroundTasks,
+    http_request: Request
+):
+    """
+    Generate PDF certificate for completed calculation.
     
-    c.setFont("Helvetica-Bold", 14)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawString(70, y_pos, f"Maximum Loan Amount: {cert_data['max_loan']}")
+    The PDF is rendered in memory and sent directly. When PDF_PERSIST is
+    enabled, a copy is written to PDF_DIR after the response is sent.
+    Responses carry a content-hash ETag; If-None-Match with a known ETag
+    gets 412 Precondition Failed without re-rendering, as RFC 9110 asks of
+    methods other than GET and HEAD.
     
-    return y_pos
+    Args:
+        certificate_id: Unique certificate identifier
+        cert_data: Complete calculation results
+    
+    Returns:
+        PDF file download
+    """
+    try:
+        # Prepare data for PDF generation
+        with STAGE_LATENCY.time("prepare_pdf_data"):
+            pdf_data = _prepare_pdf_data(cert_data)
+        
+        render_key = _pdf_data_digest(pdf_data)
+        known_etag = pdf_etags.get(render_key)
+        if known_etag and _etag_matches(http_request, known_etag):
+            return _not_modified(http_request, known_etag)
+        
+        # Generate PDF off the event loop
+        pdf_bytes = await pdf_render_pool.render(pdf_data)
+        _store_certificate_pdf(pdf_data, pdf_bytes, background_tasks)
+        
+        etag = pdf_etag(pdf_bytes)
+        pdf_etags.put(render_key, etag)
+        return _pdf_response(pdf_bytes, certificate_id, http_request, etag)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-def _draw_payment_results(
-    c: canvas.Canvas,
-    cert_data: dict,
-    y_pos: float
-) -> float:
-    """Draw payment calculation results."""
-    c.drawString(70, y_pos, f"Principal Loan Amount: {cert_data['principal_amount']}")
-    y_pos -= 25
+@app.post("/api/certificate-jobs/{certificate_id}", tags=["Certificates"])
+async def submit_certificate_job(certificate_id: str, cert_data: dict):
+    """
+    Queue a certificate render and return a job to poll instead of the PDF.
     
-    c.setFont("Helvetica-Bold", 14)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawString(70, y_pos, f"Monthly Payment: {cert_data['monthly_payment']}")
+    Returns 202 with the new job, or 200 with the existing job when this
+    certificate is already queued, rendering or done. The data must match
+    the result registered for the ID (404 if unknown, 409 if altered), as
+    only that document can be served from pdf_url.
+    """
+    try:
+        pdf_data = _prepare_pdf_data(cert_data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid certificate data: {e}")
+    await run_in_threadpool(_check_registered, pdf_data)
     
-    return y_pos
+    job, created = certificate_jobs.submit(pdf_data)
+    return JSONResponse(job.as_dict(), status_code=202 if created else 200)
 
 
-def _draw_stress_test(c: canvas.Canvas, cert_data: dict, y_pos: float) -> float:
-    """Draw stress test results if applicable."""
-    if not cert_data.get('stress_results'):
-        return y_pos
+@app.get("/api/certificate-jobs/{job_id}", tags=["Certificates"])
+async def get_certificate_job(job_id: str):
+    """Report a certificate job's status; pdf_url is set once it is done."""
+    return _find_certificate_job(job_id).as_dict()
+
+
+# Seconds between SSE keep-alive comments while a job is pending
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+
+@app.get("/api/certificate-jobs/{job_id}/events", tags=["Certificates"])
+async def certificate_job_events(job_id: str):
+    """
+    Stream a certificate job's status as server-sent events.
     
-    y_pos -= 30
-    c.setFont("Helvetica-Bold", 12)
-    c.setFillColor(COLORS["warning"])
-    c.drawString(
-        70, y_pos,
-        f"Stress Test Results (+ {cert_data['stress_bps']} bps):"
+    Sends the current status, then one event per change, and closes after
+    the job is done or failed.
+    """
+    job = _find_certificate_job(job_id)
+    return StreamingResponse(
+        _stream_job_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+
+def _find_certificate_job(job_id: str) -> CertificateJob:
+    """Look up a job or raise 404."""
+    job = certificate_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Certificate job not found or expired")
+    return job
+
+
+async def _stream_job_events(job: CertificateJob) -> AsyncIterator[str]:
+    """Yield SSE status events until the job finishes."""
+    # Take the change event before reading status so no update slips between
+    changed = job.changed
+    yield f"event: status\ndata: {json.dumps(job.as_dict())}\n\n"
     
-    y_pos -= 20
-    c.setFont("Helvetica", 11)
-    c.drawString(70, y_pos, cert_data['stress_results'])
-    
-    return y_pos
+    while job.status not in CertificateJob.TERMINAL:
+        try:
+            await asyncio.wait_for(changed.wait(), JOB_EVENTS_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        changed = job.changed
+        yield f"event: status\ndata: {json.dumps(job.as_dict())}\n\n"
 
 
-def _draw_disclaimer(c: canvas.Canvas, cert_data: dict, y_pos: float) -> float:
-    """Draw disclaimer section."""
-    y_pos -= 60
-    c.setFont("Helvetica-Bold", 12)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawString(50, y_pos, "Important Disclaimer")
+@app.get("/api/certificates/verify", tags=["Certificates"])
+async def verify_certificate(token: str = Query(..., max_length=256)):
+    """
+    Check that a certificate is genuine and unexpired from its verification code.
     
-    y_pos -= 20
-    c.setFont("Helvetica", 9)
-    c.setFillColor(COLORS["dark_green"])
+    The code printed on the certificate (and returned by /api/calculate as
+    verification_token) is checked against the signing keys in memory,
+    with no registry lookup. The signed ID, dates and key figures are
+    returned so they can be compared with the document.
+    """
+    return verify_certificate_token(token)
+
+
+@app.get("/api/certificates/{certificate_id}", tags=["Certificates"])
+async def get_certificate(
+    certificate_id: str,
+    token: Optional[str] = Query(default=None, max_length=256)
+):
+    """
+    Look up a stored calculation result by certificate ID.
     
-    disclaimer_lines = [
-        "This pre-qualification certificate is an estimate only and does not constitute a loan approval or commitment.",
-        "Final loan approval is subject to credit verification, property appraisal, and other lending criteria.",
-        f"This certificate is valid for {cert_data['validity_days']} days from the issue date.",
-        "Interest rates and terms are subject to change. Please consult with a loan officer for details."
-    ]
+    IDs are short enough to guess, so the applicant's personal details are
+    only included with a valid verification token for this certificate.
     
-    for line in disclaimer_lines:
-        c.drawString(50, y_pos, line)
-        y_pos -= 15
+    Returns:
+        The result originally returned by /api/calculate, without
+        "applicant" unless `token` proves the caller holds the certificate
+    """
+    entry = await run_in_threadpool(certificate_registry.get, certificate_id)
+    if entry is None or entry["result"] is None:
+        raise HTTPException(status_code=404, detail="Certificate not found or expired")
     
-    return y_pos
+    result = entry["result"]
+    verification = verify_certificate_token(token) if token else None
+    if verification and verification["valid"] and (
+        verification["certificate"]["certificate_id"] == certificate_id
+    ):
+        return result
+    return {key: value for key, value in result.items() if key != "applicant"}
 
 
-def _draw_footer(c: canvas.Canvas, width: float) -> None:
-    """Draw footer with branding."""
-    c.setFont("Helvetica-Bold", 10)
-    c.setFillColor(COLORS["lime_green"])
-    c.drawCentredString(width / 2, 40, "Pre-Qualification App - Your Mortgage Calculator")
+@app.get("/api/certificates/{certificate_id}/pdf", tags=["Certificates"])
+async def get_certificate_pdf(
+    certificate_id: str,
+    background_tasks: BackgroundTasks,
+    http_request: Request
+):
+    """
+    Download a certificate PDF by ID.
     
-    c.setFont("Helvetica", 8)
-    c.setFillColor(COLORS["dark_green"])
-    c.drawCentredString(width / 2, 25, "www.prequalificationapp.com")
+    Served from the registry without re-rendering when a PDF is already
+    stored; otherwise rendered once from the stored result and kept.
+    Supports If-None-Match (304) and single byte ranges (206).
+    """
+    entry = await run_in_threadpool(certificate_registry.get, certificate_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Certificate not found or expired")
+    
+    pdf_bytes = entry["pdf"]
+    if pdf_bytes is None:
+        if entry["result"] is None:
+            raise HTTPException(status_code=404, detail="Certificate not found or expired")
+        pdf_data = _prepare_pdf_data(entry["result"])
+        pdf_bytes = await pdf_render_pool.render(pdf_data)
+        _store_certificate_pdf(pdf_data, pdf_bytes, background_tasks, trusted=True)
+    
+    return _pdf_response(pdf_bytes, certificate_id, http_request)
 
-# ============================================================================
-# API ENDPOINTS
-# ============================================================================
 
-@app.get("/api/health", tags=["Health"])
-async def health_check():
-    """Check API health status."""
-    return {
-        "status": "healthy",
-        "service": "Pre-Qualification App API",
-        "version": "1.0.0"
-    }
+def _store_certificate_pdf(
+    pdf_data: dict,
+    pdf_bytes: bytes,
+    background_tasks: BackgroundTasks,
+    trusted: bool = False
+) -> None:
+    """Keep a rendered PDF after responding (see _keep_certificate_pdf)."""
+    background_tasks.add_task(_keep_certificate_pdf, pdf_data, pdf_bytes, trusted)
 
 
-@app.post("/api/calculate", tags=["Calculations"])
-async def calculate(request: CalculationRequest):
+def _keep_certificate_pdf(pdf_data: dict, pdf_bytes: bytes, trusted: bool = False) -> bool:
     """
-    Calculate pre-qualification based on input parameters.
+    Store a rendered PDF in the registry (and PDF_DIR if enabled).
     
-    Supports two calculation types:
-    - AFFORDABILITY: Calculate maximum loan from income
-    - PAYMENT: Calculate monthly payment from loan amount
+    PDFs rendered from client-posted data are kept only when that data
+    renders exactly like the result the registry stored for the ID, so a
+    repost with altered figures can never become the served document.
+    
+    Args:
+        pdf_data: Prepared certificate fields the PDF was rendered from
+        pdf_bytes: Rendered PDF document
+        trusted: The data came from the registry's own stored result
     
-    Both include optional stress testing.
+    Returns:
+        Whether the PDF was kept (False when untrusted data was refused)
     """
-    try:
-        # Generate unique certificate ID
-        cert_id = str(uuid.uuid4())[:8].upper()
-        issue_date = datetime.now()
-        expiry_date = issue_date + timedelta(days=request.validity_days)
-        
-        # Base result structure
-        result = {
-            "certificate_id": cert_id,
-            "calculation_type": request.calculation_type,
-            "applicant": request.applicant.dict(),
-            "currency": request.currency,
-            "issue_date": issue_date.strftime("%Y-%m-%d"),
-            "expiry_date": expiry_date.strftime("%Y-%m-%d"),
-            "validity_days": request.validity_days
-        }
-        
-        # Process based on calculation type
-        if request.calculation_type == "AFFORDABILITY":
-            result.update(_process_affordability(request))
-        else:
-            result.update(_process_payment(request))
-        
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    cert_id = pdf_data["certificate_id"]
+    with STAGE_LATENCY.time("pdf_store"):
+        if not trusted:
+            try:
+                _check_registered(pdf_data)
+            except HTTPException:
+                return False
+        certificate_registry.put_pdf(cert_id, pdf_data["expiry_date"], pdf_bytes)
+        if PDF_PERSIST:
+            save_certificate_pdf(cert_id, pdf_bytes)
+    return True
 
 
-def _process_affordability(request: CalculationRequest) -> dict:
-    """Process affordability calculation."""
-    if not request.affordability_input:
-        raise HTTPException(status_code=400, detail="Affordability input required")
-    
-    inp = request.affordability_input
-    
-    # Calculate affordable monthly payment
-    affordable_payment = (
-        inp.gross_monthly_income * inp.dsr_ratio
-    ) - inp.monthly_obligations
+def _check_registered(pdf_data: dict) -> None:
+    """
+    Check posted certificate data against the result registered for its ID.
     
-    # Validate positive affordability
-    if affordable_payment <= 0:
+    Raises:
+        HTTPException: 404 if the ID is not registered (or expired), 409 if
+            the data does not render like the registered result
+    """
+    entry = certificate_registry.get(pdf_data["certificate_id"])
+    if entry is None or entry["result"] is None:
+        raise HTTPException(status_code=404, detail="Certificate not found or expired")
+    if _prepare_pdf_data(entry["result"]) != pdf_data:
         raise HTTPException(
-            status_code=400,
-            detail="Monthly obligations exceed affordable debt service"
+            status_code=409, detail="Certificate data does not match the registered result"
         )
+
+
+@app.post("/api/generate-certificates", tags=["Certificates"])
+async def generate_certificates(request: BulkCertificateRequest):
+    """
+    Render many certificates and stream them back as a ZIP archive.
     
-    # Calculate maximum loan
-    max_loan = calculate_max_loan(
-        affordable_payment,
-        inp.annual_interest_rate,
-        inp.term_years
+    PDFs render in parallel on the render pool, at most one per worker at a
+    time, and each is written to the archive as soon as it is ready, so
+    memory stays flat however many certificates are requested. The archive
+    ends with manifest.json listing every input and any per-item error.
+    """
+    return StreamingResponse(
+        _stream_certificate_zip(request.certificates),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="certificates.zip"'}
     )
+
+
+class _ZipChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink that collects zipfile output for streaming."""
     
-    result = {
-        "gross_monthly_income": inp.gross_monthly_income,
-        "dsr_ratio": inp.dsr_ratio,
-        "monthly_obligations": inp.monthly_obligations,
-        "affordable_payment": round(affordable_payment, 2),
-        "affordable_payment_formatted": format_currency(affordable_payment, request.currency),
-        "max_loan_amount": max_loan,
-        "max_loan_formatted": format_currency(max_loan, request.currency),
-        "annual_interest_rate": inp.annual_interest_rate,
-        "interest_rate_percent": round(inp.annual_interest_rate * 100, 2),
-        "term_years": inp.term_years,
-        "monthly_payment": round(affordable_payment, 2)
-    }
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
     
-    # Add stress test if applicable
-    if inp.stress_rate_bps > 0:
-        result["stress_test"] = _calculate_affordability_stress_test(
-            inp, affordable_payment, max_loan, request.currency
-        )
+    def writable(self) -> bool:
+        return True
     
-    return result
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self) -> bytes:
+        """Return and forget everything written so far."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
 
-def _calculate_affordability_stress_test(
-    inp: AffordabilityInput,
-    affordable_payment: float,
-    base_max_loan: float,
-    currency: str
-) -> dict:
-    """Calculate stress test for affordability."""
-    stress_rate = inp.annual_interest_rate + (inp.stress_rate_bps / 10000)
-    stress_max_loan = calculate_max_loan(
-        affordable_payment,
-        stress_rate,
-        inp.term_years
-    )
-    
-    return {
-        "stress_rate_bps": inp.stress_rate_bps,
-        "stress_annual_rate": stress_rate,
-        "stress_rate_percent": round(stress_rate * 100, 2),
-        "stress_max_loan": stress_max_loan,
-        "stress_max_loan_formatted": format_currency(stress_max_loan, currency),
-        "reduction_amount": round(base_max_loan - stress_max_loan, 2),
-        "reduction_percent": round(
-            ((base_max_loan - stress_max_loan) / base_max_loan) * 100, 2
-        )
+async def _stream_certificate_zip(certificates: List[dict]) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of rendered certificates entry by entry."""
+    sink = _ZipChunkSink()
+    manifest: List[Optional[dict]] = [None] * len(certificates)
+    # IDs sent more than once get the item index in their entry name
+    repeated = {
+        cert_id for cert_id, count in
+        Counter(str(cert_data.get("certificate_id")) for cert_data in certificates).items()
+        if count > 1
     }
+    
+    # A non-seekable sink makes zipfile write data descriptors, so nothing is rewound
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        # aclosing cancels outstanding renders if the client goes away mid-stream
+        async with aclosing(_render_certificates(certificates)) as rendered:
+            async for index, pdf_data, pdf_bytes, error in rendered:
+                if error is not None:
+                    manifest[index] = {"index": index, "success": False, "detail": error}
+                    continue
+                
+                cert_id = pdf_data["certificate_id"]
+                suffix = f"_{index}" if cert_id in repeated else ""
+                filename = f"Pre-Qualification_Certificate_{cert_id}{suffix}.pdf"
+                archive.writestr(filename, pdf_bytes)
+                await run_in_threadpool(_keep_certificate_pdf, pdf_data, pdf_bytes)
+                manifest[index] = {
+                    "index": index,
+                    "success": True,
+                    "certificate_id": cert_id,
+                    "file": filename
+                }
+                yield sink.drain()
+        
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    
+    yield sink.drain()
 
 
-def _process_payment(request: CalculationRequest) -> dict:
-    """Process payment calculation."""
-    if not request.payment_input:
-        raise HTTPException(status_code=400, detail="Payment input required")
+async def _render_certificates(
+    certificates: List[dict]
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[bytes], Optional[str]]]:
+    """
+    Render certificates on the pool with bounded concurrency, yielding as they finish.
     
-    inp = request.payment_input
+    At most one render per worker is in flight, so renders skip the pool's
+    capacity check (a 429 here would only turn into a missing certificate).
+    Renders still pending when the generator is closed are cancelled.
+    """
     
-    # Calculate monthly payment
-    monthly_payment = calculate_monthly_payment(
-        inp.principal_amount,
-        inp.annual_interest_rate,
-        inp.term_years
-    )
+    async def render_one(index: int, cert_data: dict):
+        try:
+            pdf_data = _prepare_pdf_data(cert_data)
+            return index, pdf_data, await pdf_render_pool.render(pdf_data, bounded=False), None
+        except HTTPException as e:
+            return index, None, None, e.detail
+        except KeyError as e:
+            return index, None, None, f"Missing field {e}"
+        except Exception as e:
+            return index, None, None, str(e)
     
-    # Calculate totals
-    total_payments = monthly_payment * inp.term_years * 12
-    total_interest = total_payments - inp.principal_amount
+    queue = iter(enumerate(certificates))
+    pending = set()
     
-    result = {
-        "principal_amount": inp.principal_amount,
-        "principal_formatted": format_currency(inp.principal_amount, request.currency),
-        "monthly_payment": monthly_payment,
-        "monthly_payment_formatted": format_currency(monthly_payment, request.currency),
-        "annual_interest_rate": inp.annual_interest_rate,
-        "interest_rate_percent": round(inp.annual_interest_rate * 100, 2),
-        "term_years": inp.term_years,
-        "total_payments": round(total_payments, 2),
-        "total_payments_formatted": format_currency(total_payments, request.currency),
-        "total_interest": round(total_interest, 2),
-        "total_interest_formatted": format_currency(total_interest, request.currency)
+    try:
+        while True:
+            # Keep one render in flight per worker
+            for index, cert_data in queue:
+                pending.add(asyncio.ensure_future(render_one(index, cert_data)))
+                if len(pending) >= pdf_render_pool.workers:
+                    break
+            
+            if not pending:
+                return
+            
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _pdf_response(
+    pdf_bytes: bytes,
+    certificate_id: str,
+    http_request: Request,
+    etag: Optional[str] = None
+) -> Response:
+    """
+    Build a PDF download response with a content-hash ETag.
+    
+    Answers a matching If-None-Match with 304 (412 for POST) and, for
+    GET, a single "bytes=" Range (honouring If-Range) with 206.
+    """
+    etag = etag or pdf_etag(pdf_bytes)
+    if _etag_matches(http_request, etag):
+        return _not_modified(http_request, etag)
+    
+    headers = {
+        "Content-Disposition": (
+            f'attachment; filename="Pre-Qualification_Certificate_{certificate_id}.pdf"'
+        ),
+        "ETag": etag,
+        "Accept-Ranges": "bytes"
     }
     
-    # Add stress test if applicable
-    if inp.stress_rate_bps > 0:
-        result["stress_test"] = _calculate_payment_stress_test(
-            inp, monthly_payment, request.currency
-        )
+    if_range = http_request.headers.get("if-range")
+    if http_request.method == "GET" and (if_range is None or if_range.strip() == etag):
+        byte_range = _byte_range(http_request.headers.get("range"), len(pdf_bytes))
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(pdf_bytes)}"
+            return Response(
+                content=pdf_bytes[start:end + 1],
+                status_code=206,
+                media_type="application/pdf",
+                headers=headers
+            )
     
-    return result
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
 
-def _calculate_payment_stress_test(
-    inp: PaymentInput,
-    base_payment: float,
-    currency: str
-) -> dict:
-    """Calculate stress test for payment."""
-    stress_rate = inp.annual_interest_rate + (inp.stress_rate_bps / 10000)
-    stress_payment = calculate_monthly_payment(
-        inp.principal_amount,
-        stress_rate,
-        inp.term_years
-    )
-    
-    return {
-        "stress_rate_bps": inp.stress_rate_bps,
-        "stress_annual_rate": stress_rate,
-        "stress_rate_percent": round(stress_rate * 100, 2),
-        "stress_monthly_payment": stress_payment,
-        "stress_payment_formatted": format_currency(stress_payment, currency),
-        "increase_amount": round(stress_payment - base_payment, 2),
-        "increase_percent": round(
-            ((stress_payment - base_payment) / base_payment) * 100, 2
-        )
-    }
+def pdf_etag(pdf_bytes: bytes) -> str:
+    """Strong ETag from the PDF's SHA-256."""
+    return f'"{hashlib.sha256(pdf_bytes).hexdigest()[:32]}"'
 
 
-@app.post("/api/generate-certificate/{certificate_id}", tags=["Certificates"])
-async def generate_certificate(certificate_id: str, cert_data: dict):
+def _pdf_data_digest(pdf_data: dict) -> tuple:
+    """Key rendered-PDF ETags by their render input."""
+    return (hashlib.sha256(json.dumps(pdf_data, sort_keys=True, default=str).encode()).hexdigest(),)
+
+
+def _etag_matches(http_request: Request, etag: str) -> bool:
+    """Whether If-None-Match names this ETag (weak comparison, as RFC 9110 asks)."""
+    header = http_request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def _not_modified(http_request: Request, etag: str) -> Response:
+    """304 for GET and HEAD; other methods get 412 when If-None-Match matches."""
+    status_code = 304 if http_request.method in ("GET", "HEAD") else 412
+    return Response(status_code=status_code, headers={"ETag": etag, "Accept-Ranges": "bytes"})
+
+
+def _byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
     """
-    Generate PDF certificate for completed calculation.
-    
-    Args:
-        certificate_id: Unique certificate identifier
-        cert_data: Complete calculation results
+    Parse a single-range "bytes=" header into inclusive (start, end).
     
-    Returns:
-        PDF file download
+    Returns None (send the whole body) for absent, malformed or multi-range
+    headers; raises 416 when the range lies beyond the body.
     """
-    try:
-        # Prepare data for PDF generation
-        pdf_data = _prepare_pdf_data(cert_data)
-        
-        # Generate PDF
-        pdf_path = generate_certificate_pdf(pdf_data)
-        
-        return FileResponse(
-            pdf_path,
-            media_type="application/pdf",
-            filename=f"Pre-Qualification_Certificate_{certificate_id}.pdf"
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the final N bytes
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            start = size
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
         )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return start, end
 
 
 def _prepare_pdf_data(cert_data: dict) -> dict:
     """Prepare calculation data for PDF generation."""
+    if not CERTIFICATE_ID_PATTERN.fullmatch(str(cert_data["certificate_id"])):
+        raise HTTPException(status_code=400, detail="Invalid certificate ID")
+    
     pdf_data = {
         "certificate_id": cert_data["certificate_id"],
         "issue_date": cert_data["issue_date"],
@@ -771,4 +4822,17 @@ def _prepare_pdf_data(cert_data: dict) -> dict:
             )
             pdf_data["stress_bps"] = st["stress_rate_bps"]
     
+    # Print the code only if it was issued for exactly these figures
+    token = cert_data.get("verification_token")
+    if isinstance(token, str) and hmac.compare_digest(token, _sign_if_complete(cert_data)):
+        pdf_data["verification_token"] = token
+    
     return pdf_data
+
+
+def _sign_if_complete(cert_data: dict) -> str:
+    """Sign posted certificate data, or return "" if it lacks signed fields."""
+    try:
+        return sign_certificate(cert_data)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return ""
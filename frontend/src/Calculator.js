@@ -1,9 +1,61 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import './App.css';
 import axios from 'axios';
 import { useTheme } from './ThemeContext';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || '';
+const LIVE_URL = `${(BACKEND_URL || window.location.origin).replace(/^http/, 'ws')}/api/calculate/live`;
+const LIVE_RECONNECT_MS = 2000;
+
+// Numeric form values as the API expects them; blanks become null so the server drops them
+const toNumber = (value) => {
+  const number = parseFloat(value);
+  return Number.isFinite(number) ? number : null;
+};
+
+// Fields of `next` that differ from `prev`, one level deep into input objects
+const diffLiveState = (prev, next) => {
+  const changes = {};
+  Object.entries(next).forEach(([key, value]) => {
+    if (value && typeof value === 'object') {
+      const section = {};
+      Object.entries(value).forEach(([field, fieldValue]) => {
+        if (prev[key]?.[field] !== fieldValue) section[field] = fieldValue;
+      });
+      if (Object.keys(section).length) changes[key] = section;
+    } else if (prev[key] !== value) {
+      changes[key] = value;
+    }
+  });
+  return changes;
+};
+
+// Apply a live reply's changed fields and removed (dotted) paths to the previous result
+const mergeLiveResult = (prev, changed, removed) => {
+  const merge = (base, patch) => {
+    const out = { ...base };
+    Object.entries(patch).forEach(([key, value]) => {
+      out[key] = value && typeof value === 'object' && !Array.isArray(value) && base[key]
+        ? merge(base[key], value)
+        : value;
+    });
+    return out;
+  };
+  const result = merge(prev || {}, changed);
+  removed.forEach((path) => {
+    const keys = path.split('.');
+    const last = keys.pop();
+    // Copy the objects along the path so the previous result stays untouched
+    let node = result;
+    for (const key of keys) {
+      if (!node[key]) return;
+      node[key] = { ...node[key] };
+      node = node[key];
+    }
+    delete node[last];
+  });
+  return result;
+};
 
 function Calculator() {
   const { darkMode, toggleDarkMode } = useTheme();
@@ -32,6 +84,88 @@ function Calculator() {
   const [currency, setCurrency] = useState('TTD');
   const [validityDays, setValidityDays] = useState('90');
   
+  // Live preview over a WebSocket; certificates are only issued on submit
+  const [liveResult, setLiveResult] = useState(null);
+  const [liveError, setLiveError] = useState(null);
+  const liveSocket = useRef(null);
+  const liveState = useRef({});
+  const liveSent = useRef({});
+  const liveSeq = useRef(0);
+  
+  const sendLiveChanges = () => {
+    const socket = liveSocket.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    const changes = diffLiveState(liveSent.current, liveState.current);
+    if (!Object.keys(changes).length) return;
+    liveSeq.current += 1;
+    socket.send(JSON.stringify({ seq: liveSeq.current, changes }));
+    liveSent.current = JSON.parse(JSON.stringify(liveState.current));
+  };
+  
+  useEffect(() => {
+    let closed = false;
+    let retry = null;
+    
+    const connect = () => {
+      const socket = new WebSocket(LIVE_URL);
+      liveSocket.current = socket;
+      socket.onopen = () => {
+        // A fresh session starts empty, so send the whole form
+        liveSent.current = {};
+        setLiveResult(null);
+        sendLiveChanges();
+      };
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'result') {
+          setLiveResult((prev) => mergeLiveResult(prev, message.changed, message.removed));
+          setLiveError(null);
+        } else if (message.type === 'error') {
+          setLiveError(message.detail);
+        }
+      };
+      socket.onclose = () => {
+        if (!closed) retry = setTimeout(connect, LIVE_RECONNECT_MS);
+      };
+    };
+    
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      liveSocket.current?.close();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+  
+  useEffect(() => {
+    const percent = toNumber(interestRate);
+    const term = toNumber(termYears);
+    const common = {
+      annual_interest_rate: percent === null ? null : percent / 100,
+      term_years: term === null ? null : Math.trunc(term),
+      stress_rate_bps: Math.trunc(toNumber(stressRateBps) || 0)
+    };
+    liveState.current = {
+      calculation_type: calculationType,
+      currency: currency,
+      affordability_input: {
+        gross_monthly_income: toNumber(grossIncome),
+        dsr_ratio: toNumber(dsrRatio),
+        monthly_obligations: toNumber(monthlyObligations) || 0,
+        ...common
+      },
+      payment_input: {
+        principal_amount: toNumber(principalAmount),
+        ...common
+      }
+    };
+    sendLiveChanges();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [calculationType, currency, grossIncome, dsrRatio, monthlyObligations, principalAmount, interestRate, termYears, stressRateBps]);
+  
+  const livePreview = liveResult && !liveError && liveResult.calculation_type === calculationType ? liveResult : null;
+  
   const handleCalculate = async (e) => {
     e.preventDefault();
     setError(null);
@@ -345,6 +479,18 @@ function Calculator() {
               </div>
             </div>
 
+            {/* Live Preview */}
+            {livePreview && (
+              <div className="flex justify-between items-center bg-green-50 dark:bg-green-900/20 border border-lime/30 rounded-lg px-4 py-3">
+                <span className="text-sm text-gray-600 dark:text-gray-400">
+                  {calculationType === 'AFFORDABILITY' ? 'Estimated Maximum Loan' : 'Estimated Monthly Payment'}
+                </span>
+                <span className="text-lg font-bold text-lime">
+                  {calculationType === 'AFFORDABILITY' ? livePreview.max_loan_formatted : livePreview.monthly_payment_formatted}
+                </span>
+              </div>
+            )}
+
             {/* Submit Button */}
             <button
               type="submit"
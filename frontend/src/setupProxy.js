@@ -7,6 +7,7 @@ module.exports = function(app) {
       target: 'http://localhost:8001',
       changeOrigin: true,
       secure: false,
+      ws: true,
     })
   );
 };